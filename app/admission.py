@@ -0,0 +1,106 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+# --- Configuration ---
+# Maximum number of on-demand nmap scans running at the same time
+MAX_RUNNING_SCANS = int(os.environ.get("MAX_RUNNING_SCANS", 4))
+# Maximum number of scans waiting for a slot; further requests get a 429
+MAX_QUEUED_SCANS = int(os.environ.get("MAX_QUEUED_SCANS", 16))
+# Assumed scan duration for wait estimates until a scan has finished
+INITIAL_SCAN_SECONDS = 60
+
+
+class AdmissionFull(Exception):
+    """Raised when every scan slot is busy and the wait queue is full."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ScanAdmission:
+    """
+    Limits how many scans run at once. Scans beyond the limit wait in a bounded
+    FIFO queue; once that is full too, new scans are refused with AdmissionFull.
+    All methods must be called from the event loop thread.
+    """
+
+    def __init__(self, max_running=MAX_RUNNING_SCANS, max_queued=MAX_QUEUED_SCANS):
+        self.max_running = max(1, max_running)
+        self.max_queued = max(0, max_queued)
+        self.running = 0
+        self.waiters = deque()
+        # Moving average of recent scan durations, for wait estimates
+        self.average_seconds = None
+
+    def estimated_wait(self):
+        """Seconds until a scan submitted now would start, roughly."""
+        if self.running < self.max_running and not self.waiters:
+            return 0
+        average = self.average_seconds or INITIAL_SCAN_SECONDS
+        # The scans ahead run max_running at a time
+        return average * (len(self.waiters) // self.max_running + 1)
+
+    def check(self):
+        """Raises AdmissionFull if a scan submitted now would be refused."""
+        if self.running >= self.max_running and len(self.waiters) >= self.max_queued:
+            raise AdmissionFull(
+                f"{self.running} scans are running and {len(self.waiters)} are"
+                " queued. Try again later.",
+                max(1, math.ceil(self.estimated_wait())),
+            )
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "queued": len(self.waiters),
+            "max_running": self.max_running,
+            "max_queued": self.max_queued,
+            "average_scan_seconds": self.average_seconds,
+            "estimated_wait_seconds": self.estimated_wait(),
+        }
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds a scan slot for the duration of the block, waiting for one if needed."""
+        self.check()
+        if self.running < self.max_running and not self.waiters:
+            self.running += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as we gave up; pass it on
+                    self._release()
+                else:
+                    self.waiters.remove(waiter)
+                raise
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record(time.monotonic() - started)
+            self._release()
+
+    def _record(self, seconds):
+        if self.average_seconds is None:
+            self.average_seconds = seconds
+        else:
+            self.average_seconds = 0.8 * self.average_seconds + 0.2 * seconds
+
+    def _release(self):
+        # Hand the slot straight to the next waiter, if there is one
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.running -= 1
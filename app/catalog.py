@@ -0,0 +1,839 @@
+import hashlib
+import ipaddress
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from app import jsonstream
+from app.hosts import HostIndexer
+
+# The catalog lives next to the scan files so both containers share it
+CATALOG_FILENAME = "catalog.sqlite3"
+# Symlinks to the newest scan file and the newest successful one
+LATEST_POINTER = "latest.json"
+LATEST_SUCCESSFUL_POINTER = "latest_successful.json"
+POINTERS = (LATEST_POINTER, LATEST_SUCCESSFUL_POINTER)
+# Scans stored as deltas against an earlier scan (see app/storage.py) live here
+DELTAS_SUBDIR = "deltas"
+
+# Schema changes, applied in order. PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    """
+    CREATE TABLE scans (
+        filename TEXT PRIMARY KEY,
+        scan_timestamp_utc TEXT,
+        scan_target TEXT,
+        scan_successful INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX scans_by_timestamp ON scans (scan_timestamp_utc)",
+    # Content hash of the file, used as its ETag
+    "ALTER TABLE scans ADD COLUMN sha256 TEXT",
+    "CREATE INDEX scans_by_target ON scans (scan_target, filename)",
+    # Where each host's record starts in a scan file, and how long it is
+    """
+    CREATE TABLE hosts (
+        address TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        PRIMARY KEY (address, filename)
+    )
+    """,
+    "CREATE INDEX hosts_by_filename ON hosts (filename)",
+    # Every port reported in every scan
+    """
+    CREATE TABLE ports (
+        filename TEXT NOT NULL,
+        address TEXT NOT NULL,
+        protocol TEXT NOT NULL,
+        port INTEGER NOT NULL,
+        state TEXT,
+        service TEXT,
+        product TEXT,
+        version TEXT,
+        PRIMARY KEY (filename, address, protocol, port)
+    )
+    """,
+    "CREATE INDEX ports_by_port ON ports (protocol, port, state, filename)",
+    # The newest successful scan that reported each host that is currently up
+    """
+    CREATE TABLE current_hosts (
+        address TEXT PRIMARY KEY,
+        filename TEXT NOT NULL
+    )
+    """,
+    # How each scan is stored: "full", or "delta" against `base`, `chain`
+    # deltas away from the nearest full keyframe
+    "ALTER TABLE scans ADD COLUMN storage TEXT NOT NULL DEFAULT 'full'",
+    "ALTER TABLE scans ADD COLUMN base TEXT",
+    "ALTER TABLE scans ADD COLUMN chain INTEGER NOT NULL DEFAULT 0",
+    # How long the scanner's nmap runs took, in seconds, and how many hosts they found
+    "ALTER TABLE scans ADD COLUMN duration REAL",
+    "ALTER TABLE scans ADD COLUMN host_count INTEGER",
+    # "incremental" for scans that only port-scanned part of the target;
+    # "full" or NULL otherwise
+    "ALTER TABLE scans ADD COLUMN scan_mode TEXT",
+    # Bookkeeping such as when the catalog was last synced with the files
+    "CREATE TABLE catalog_state (key TEXT PRIMARY KEY, value TEXT)",
+    # A host's ports rarely change between scans, so each distinct set of port
+    # rows is stored once and every scan's host refers to its set
+    "CREATE TABLE port_sets (id INTEGER PRIMARY KEY, digest TEXT NOT NULL UNIQUE)",
+    """
+    CREATE TABLE port_set_ports (
+        set_id INTEGER NOT NULL,
+        protocol TEXT NOT NULL,
+        port INTEGER NOT NULL,
+        state TEXT,
+        service TEXT,
+        product TEXT,
+        version TEXT,
+        PRIMARY KEY (set_id, protocol, port)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX port_set_ports_by_port ON port_set_ports (protocol, port, state)",
+    """
+    CREATE TABLE host_ports (
+        filename TEXT NOT NULL,
+        address TEXT NOT NULL,
+        set_id INTEGER NOT NULL,
+        PRIMARY KEY (filename, address)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX host_ports_by_set ON host_ports (set_id)",
+    lambda conn: _move_ports_to_sets(conn),
+    "DROP TABLE ports",
+]
+
+# The port rows of a scan, in the columns of the former `ports` table
+PORT_ROWS = (
+    "SELECT host_ports.filename, host_ports.address, protocol, port, state,"
+    " service, product, version FROM host_ports JOIN port_set_ports"
+    " ON port_set_ports.set_id = host_ports.set_id"
+)
+
+
+def is_scan_file(filename):
+    """True for scan result files, as opposed to the pointers and other bookkeeping."""
+    return filename.endswith(".json") and filename not in POINTERS
+
+
+def catalog_path(results_dir):
+    return os.path.join(results_dir, CATALOG_FILENAME)
+
+
+def stored_relpath(filename, storage="full"):
+    """Returns where a scan's file lives, relative to the results directory."""
+    if storage == "delta":
+        return os.path.join(DELTAS_SUBDIR, filename)
+    return filename
+
+
+def stored_path(results_dir, filename, storage="full"):
+    return os.path.join(results_dir, stored_relpath(filename, storage))
+
+
+def connect(results_dir):
+    """Opens the catalog in `results_dir`, creating or upgrading its schema as needed."""
+    conn = sqlite3.connect(catalog_path(results_dir), timeout=30)
+    conn.row_factory = sqlite3.Row
+    if conn.execute("PRAGMA user_version").fetchone()[0] < len(MIGRATIONS):
+        # sqlite3 runs DDL outside implicit transactions, so take the write
+        # lock explicitly and re-read the version: another process (the API or
+        # the scanner) may have migrated the catalog while we waited.
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for statement in MIGRATIONS[version:]:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            conn.close()
+            raise
+        if 0 < version < len(MIGRATIONS):
+            # Migrations may move rows to smaller tables; give the space back.
+            # Only worth it, not required, so a busy catalog is left as it is
+            try:
+                conn.execute("VACUUM")
+            except sqlite3.OperationalError:
+                pass
+    return conn
+
+
+def record_scan(
+    results_dir,
+    filename,
+    scan,
+    sha256=None,
+    index=None,
+    storage="full",
+    base=None,
+    chain=0,
+    duration=None,
+):
+    """
+    Adds (or replaces) the catalog entry for a scan file that was just written.
+    `sha256` is the hex digest of the scan's full JSON text, if the writer
+    computed it. `index` is the HostIndexer that saw that text being produced;
+    its host locations and ports feed the host history and port indexes.
+    Delta-stored scans also pass `storage="delta"`, their `base` and `chain`.
+    `duration` is how long the scan took, in seconds, if it was measured.
+    """
+    size = os.path.getsize(stored_path(results_dir, filename, storage))
+    host_count = None
+    if index is not None:
+        host_count = len({address for address, _, _ in index.rows})
+    conn = connect(results_dir)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO scans (filename, scan_timestamp_utc,"
+                " scan_target, scan_successful, size, sha256, storage, base, chain,"
+                " duration, host_count, scan_mode)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    filename,
+                    scan.get("scan_timestamp_utc"),
+                    scan.get("scan_target"),
+                    bool(scan.get("scan_successful")),
+                    size,
+                    sha256,
+                    storage,
+                    base,
+                    chain,
+                    duration,
+                    host_count,
+                    scan.get("scan_mode"),
+                ),
+            )
+            conn.execute("DELETE FROM hosts WHERE filename = ?", (filename,))
+            conn.execute("DELETE FROM host_ports WHERE filename = ?", (filename,))
+            if index is not None:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO hosts VALUES (?, ?, ?, ?)",
+                    [
+                        (address, filename, position, length)
+                        for address, position, length in index.rows
+                    ],
+                )
+                _record_ports(conn, filename, index.ports)
+                if scan.get("scan_successful"):
+                    _update_current_hosts(
+                        conn,
+                        filename,
+                        scan.get("scan_target"),
+                        {address for address, _, _ in index.rows},
+                    )
+    finally:
+        conn.close()
+
+
+def _record_ports(conn, filename, ports):
+    """Stores a scan's port rows, (address, protocol, port, ...) tuples, as port sets."""
+    by_address = {}
+    for address, *port in ports:
+        # Later rows win, like the replaced rows of a plain table would
+        by_address.setdefault(address, {})[tuple(port[:2])] = tuple(port)
+    conn.executemany(
+        "INSERT OR REPLACE INTO host_ports VALUES (?, ?, ?)",
+        [
+            (filename, address, _port_set(conn, rows.values()))
+            for address, rows in by_address.items()
+        ],
+    )
+
+
+def _port_set(conn, rows):
+    """Returns the id of the port set holding exactly `rows`, adding it if it is new."""
+    rows = sorted(rows, key=lambda row: (row[0] or "", row[1]))
+    digest = hashlib.sha256(json.dumps(rows).encode()).hexdigest()
+    found = conn.execute(
+        "SELECT id FROM port_sets WHERE digest = ?", (digest,)
+    ).fetchone()
+    if found:
+        return found[0]
+    set_id = conn.execute(
+        "INSERT INTO port_sets (digest) VALUES (?)", (digest,)
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO port_set_ports VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(set_id, *row) for row in rows],
+    )
+    return set_id
+
+
+def _move_ports_to_sets(conn):
+    """Migrates the per-scan rows of the former `ports` table into port sets."""
+    rows = conn.execute(
+        "SELECT filename, address, protocol, port, state, service, product, version"
+        " FROM ports ORDER BY filename"
+    )
+    filename = None
+    ports = []
+    for row in rows.fetchall():
+        if row[0] != filename:
+            if ports:
+                _record_ports(conn, filename, ports)
+            filename = row[0]
+            ports = []
+        ports.append(tuple(row[1:]))
+    if ports:
+        _record_ports(conn, filename, ports)
+
+
+def _update_current_hosts(conn, filename, target, addresses):
+    """
+    Makes `filename` the current source for every host it reported, and drops
+    hosts inside its target range that it did not report (they are down).
+    Hosts already taken from a newer scan are left alone, so files may be
+    recorded out of order.
+    """
+    try:
+        network = ipaddress.ip_network(target, strict=False)
+    except (TypeError, ValueError):
+        network = None
+
+    if network is not None:
+        older = conn.execute(
+            "SELECT address FROM current_hosts WHERE filename < ?", (filename,)
+        )
+        gone = [
+            (address,)
+            for (address,) in older
+            if address not in addresses and ipaddress.ip_address(address) in network
+        ]
+        conn.executemany("DELETE FROM current_hosts WHERE address = ?", gone)
+
+    conn.executemany(
+        "INSERT INTO current_hosts VALUES (?, ?) ON CONFLICT (address)"
+        " DO UPDATE SET filename = excluded.filename"
+        " WHERE excluded.filename > current_hosts.filename",
+        [(address, filename) for address in addresses],
+    )
+
+
+def remove_scans(results_dir, filenames):
+    """
+    Drops deleted scans from the catalog, with their host and port rows. Hosts
+    whose current state came from a removed scan fall back to the newest
+    remaining successful scan that reported them.
+    """
+    conn = connect(results_dir)
+    try:
+        with conn:
+            for table in ("scans", "hosts", "host_ports"):
+                conn.executemany(
+                    f"DELETE FROM {table} WHERE filename = ?",
+                    [(filename,) for filename in filenames],
+                )
+            # Port sets no scan refers to any more
+            conn.execute(
+                "DELETE FROM port_sets WHERE id NOT IN (SELECT set_id FROM host_ports)"
+            )
+            conn.execute(
+                "DELETE FROM port_set_ports"
+                " WHERE set_id NOT IN (SELECT id FROM port_sets)"
+            )
+            conn.execute(
+                "UPDATE current_hosts SET filename = ("
+                " SELECT MAX(hosts.filename) FROM hosts JOIN scans"
+                " ON scans.filename = hosts.filename"
+                " WHERE hosts.address = current_hosts.address AND scan_successful)"
+                " WHERE filename NOT IN (SELECT filename FROM scans)"
+            )
+            conn.execute("DELETE FROM current_hosts WHERE filename IS NULL")
+    finally:
+        conn.close()
+
+
+def mark_keyframe(results_dir, filename):
+    """Records that a delta-stored scan has been rewritten as a full file."""
+    conn = connect(results_dir)
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE scans SET storage = 'full', base = NULL, chain = 0, size = ?"
+                " WHERE filename = ?",
+                (os.path.getsize(stored_path(results_dir, filename)), filename),
+            )
+    finally:
+        conn.close()
+
+
+def file_sha256(path):
+    """Returns the hex SHA-256 digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_entry(results_dir, filename):
+    """Returns the catalog row of a scan as a dictionary, or None."""
+    conn = connect(results_dir)
+    try:
+        row = conn.execute(
+            "SELECT * FROM scans WHERE filename = ?", (filename,)
+        ).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def scan_entries(results_dir):
+    """Returns the catalog rows of all scans as dictionaries, oldest first."""
+    conn = connect(results_dir)
+    try:
+        return [
+            dict(row) for row in conn.execute("SELECT * FROM scans ORDER BY filename")
+        ]
+    finally:
+        conn.close()
+
+
+def scan_sha256(results_dir, filename):
+    """
+    Returns the stored content hash of a scan file. Files catalogued before
+    hashes were recorded are hashed once and the result is stored.
+    """
+    conn = connect(results_dir)
+    try:
+        row = conn.execute(
+            "SELECT sha256 FROM scans WHERE filename = ?", (filename,)
+        ).fetchone()
+        if row and row["sha256"]:
+            return row["sha256"]
+        sha256 = file_sha256(os.path.join(results_dir, filename))
+        if row:
+            with conn:
+                conn.execute(
+                    "UPDATE scans SET sha256 = ? WHERE filename = ?",
+                    (sha256, filename),
+                )
+        return sha256
+    finally:
+        conn.close()
+
+
+def sync_catalog(results_dir):
+    """
+    Adds any scan files in `results_dir` that the catalog does not know about yet,
+    e.g. history written before the catalog existed. Returns the number added.
+    """
+    conn = connect(results_dir)
+    try:
+        known = {row[0] for row in conn.execute("SELECT filename FROM scans")}
+    finally:
+        conn.close()
+
+    missing = [
+        (f, "full")
+        for f in os.listdir(results_dir)
+        if is_scan_file(f) and f not in known
+    ]
+    deltas_dir = os.path.join(results_dir, DELTAS_SUBDIR)
+    if os.path.isdir(deltas_dir):
+        missing += [
+            (f, "delta")
+            for f in os.listdir(deltas_dir)
+            if f.endswith(".json") and f not in known
+        ]
+
+    # Oldest first, so delta bases are known before the scans built on them and
+    # the current host state ends up reflecting the newest scan
+    added = 0
+    for filename, storage in sorted(missing):
+        if storage == "delta":
+            added += _sync_delta(results_dir, filename)
+            continue
+        _sync_file(results_dir, filename)
+        added += 1
+
+    # Only now is the catalog complete; ensure_catalog() relies on this marker
+    conn = connect(results_dir)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO catalog_state VALUES ('synced', ?)",
+                (datetime.now(timezone.utc).isoformat(),),
+            )
+    finally:
+        conn.close()
+    return added
+
+
+def add_scan_file(results_dir, filename):
+    """
+    Catalogues one full scan file the catalog missed, e.g. because the
+    scanner's catalog write failed, and returns its catalog entry.
+    """
+    _sync_file(results_dir, filename)
+    return scan_entry(results_dir, filename)
+
+
+def _sync_file(results_dir, filename):
+    sha256 = None
+    index = None
+    try:
+        with open(os.path.join(results_dir, filename), "rb") as f:
+            content = f.read()
+        sha256 = hashlib.sha256(content).hexdigest()
+        scan = json.loads(content)
+        index = _index_scan(scan, sha256)
+    except (OSError, ValueError):
+        # Unreadable files are still listed, as they were before the catalog
+        scan = {}
+    record_scan(results_dir, filename, scan, sha256, index)
+
+
+def _sync_delta(results_dir, filename):
+    """Catalogues a delta-stored scan by rebuilding it. Returns 1, or 0 if its base is unknown."""
+    # Imported here because app.storage itself builds on the catalog
+    from app import storage
+
+    with open(stored_path(results_dir, filename, "delta"), "r") as f:
+        stored = json.load(f)
+    base_entry = scan_entry(results_dir, stored["base"])
+    if base_entry is None:
+        return 0
+
+    scan = storage.apply_delta(
+        storage.load_document(results_dir, stored["base"]), stored["delta"]
+    )
+    writer = jsonstream.HashingWriter()
+    index = HostIndexer()
+    jsonstream.dump(scan, writer, indent=4, on_value=index)
+    record_scan(
+        results_dir,
+        filename,
+        scan,
+        writer.digest.hexdigest(),
+        index,
+        storage="delta",
+        base=stored["base"],
+        chain=base_entry["chain"] + 1,
+    )
+    return 1
+
+
+def _index_scan(scan, sha256):
+    """
+    Indexes the hosts of an existing scan file by serialising its parsed content
+    again the way the scanner writes it. If that does not reproduce the file
+    exactly (`sha256` differs), the host offsets would be wrong, so they are
+    dropped and only the ports are kept.
+    """
+    writer = jsonstream.HashingWriter()
+    index = HostIndexer()
+    jsonstream.dump(scan, writer, indent=4, on_value=index)
+    if writer.digest.hexdigest() != sha256:
+        index.rows = []
+    return index
+
+
+# Results directories whose catalog this process has seen fully synced
+_synced = set()
+_sync_lock = threading.Lock()
+
+
+def is_synced(results_dir):
+    """True once a sync_catalog() has completed for the catalog in `results_dir`."""
+    conn = connect(results_dir)
+    try:
+        row = conn.execute(
+            "SELECT value FROM catalog_state WHERE key = 'synced'"
+        ).fetchone()
+        return row is not None
+    finally:
+        conn.close()
+
+
+def ensure_catalog(results_dir):
+    """
+    Builds the catalog from the files on disk unless it has been synced before.
+    Other lookups may have created an empty catalog first, so this goes by the
+    sync marker, not by whether the file exists. Concurrent callers wait for
+    one sync rather than read a half-built catalog.
+    """
+    if results_dir in _synced and os.path.exists(catalog_path(results_dir)):
+        return
+    with _sync_lock:
+        if not is_synced(results_dir):
+            sync_catalog(results_dir)
+        _synced.add(results_dir)
+
+
+def list_scans(
+    results_dir,
+    limit=None,
+    cursor=None,
+    since=None,
+    until=None,
+    target=None,
+    successful=None,
+):
+    """
+    Returns catalogued scan filenames, sorted newest to oldest, and the cursor
+    for the next page (None when there are no more results).
+
+    `cursor` is the last filename of the previous page. `since` (inclusive) and
+    `until` (exclusive) are ISO 8601 UTC timestamp strings compared against
+    scan_timestamp_utc; `target` and `successful` filter on exact values.
+    """
+    conditions = []
+    params = []
+    if cursor is not None:
+        conditions.append("filename < ?")
+        params.append(cursor)
+    if since is not None:
+        conditions.append("scan_timestamp_utc >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("scan_timestamp_utc < ?")
+        params.append(until)
+    if target is not None:
+        conditions.append("scan_target = ?")
+        params.append(target)
+    if successful is not None:
+        conditions.append("scan_successful = ?")
+        params.append(bool(successful))
+
+    query = "SELECT filename FROM scans"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY filename DESC"
+    if limit is not None:
+        # Fetch one extra row to learn whether another page exists
+        query += " LIMIT ?"
+        params.append(limit + 1)
+
+    conn = connect(results_dir)
+    try:
+        files = [row["filename"] for row in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+    if limit is not None and len(files) > limit:
+        files = files[:limit]
+        return files, files[-1]
+    return files, None
+
+
+def latest_scan(results_dir, successful=False):
+    """Returns the filename of the newest catalogued scan (or successful scan), or None."""
+    query = "SELECT filename FROM scans"
+    if successful:
+        query += " WHERE scan_successful"
+    conn = connect(results_dir)
+    try:
+        row = conn.execute(query + " ORDER BY filename DESC LIMIT 1").fetchone()
+        return row["filename"] if row else None
+    finally:
+        conn.close()
+
+
+def latest_scans_by_target(results_dir, since=None):
+    """
+    Returns the catalog row of the newest successful full scan of each target,
+    as dictionaries, optionally only among scans from `since` onwards.
+    """
+    query = (
+        "SELECT * FROM scans WHERE filename IN (SELECT MAX(filename) FROM scans"
+        " WHERE scan_successful AND COALESCE(scan_mode, 'full') = 'full'"
+    )
+    params = []
+    if since is not None:
+        query += " AND scan_timestamp_utc >= ?"
+        params.append(since)
+    query += " GROUP BY scan_target)"
+    conn = connect(results_dir)
+    try:
+        return [dict(row) for row in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+
+def _point(results_dir, pointer, relpath):
+    # Create the new symlink under a temporary name, then rename it over the old
+    # one, so readers always find either the previous or the new target
+    tmp_path = os.path.join(results_dir, pointer + ".tmp")
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    os.symlink(relpath, tmp_path)
+    os.replace(tmp_path, os.path.join(results_dir, pointer))
+
+
+def update_latest_pointers(results_dir, filename, successful, storage="full"):
+    """Points latest.json (and latest_successful.json, for a successful scan) at `filename`."""
+    relpath = stored_relpath(filename, storage)
+    _point(results_dir, LATEST_POINTER, relpath)
+    if successful:
+        _point(results_dir, LATEST_SUCCESSFUL_POINTER, relpath)
+
+
+def move_latest_pointers(results_dir, filename, storage="full"):
+    """Repoints whichever latest pointers refer to `filename` at where it is stored now."""
+    for pointer in POINTERS:
+        path = os.path.join(results_dir, pointer)
+        if os.path.islink(path) and os.path.basename(os.readlink(path)) == filename:
+            _point(results_dir, pointer, stored_relpath(filename, storage))
+
+
+def resolve_latest(results_dir, successful=False):
+    """
+    Returns the filename of the scan the latest pointer refers to. Falls back
+    to the catalog if the pointer has not been written yet. Returns None if
+    there are no scans.
+    """
+    pointer = LATEST_SUCCESSFUL_POINTER if successful else LATEST_POINTER
+    # Resolve the symlink once, so the caller serves one consistent scan even
+    # if the pointer moves while the response is being sent
+    path = os.path.realpath(os.path.join(results_dir, pointer))
+    if os.path.isfile(path):
+        return os.path.basename(path)
+
+    ensure_catalog(results_dir)
+    return latest_scan(results_dir, successful)
+
+
+def host_history(results_dir, address, limit=None):
+    """
+    Returns the scans containing `address`, newest first, with the position
+    and length of its record in each scan file.
+    """
+    query = (
+        "SELECT hosts.filename, position, length, scan_timestamp_utc, scan_target"
+        " FROM hosts JOIN scans ON scans.filename = hosts.filename"
+        " WHERE address = ? ORDER BY hosts.filename DESC"
+    )
+    params = [address]
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    conn = connect(results_dir)
+    try:
+        return [dict(row) for row in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+
+def host_location(results_dir, filename, address):
+    """
+    Returns where `address`'s record is in a scan's full JSON text (position
+    and length) and its index among the scan's hosts, or None.
+    """
+    conn = connect(results_dir)
+    try:
+        row = conn.execute(
+            "SELECT position, length, (SELECT COUNT(DISTINCT position) FROM hosts"
+            " AS earlier WHERE earlier.filename = hosts.filename"
+            " AND earlier.position < hosts.position) AS host_index"
+            " FROM hosts WHERE filename = ? AND address = ?",
+            (filename, address),
+        ).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def hosts_with_port(results_dir, protocol, port, state, filename=None):
+    """
+    Returns the hosts reporting `port` in `state`, either in one scan file or,
+    by default, in the current state of each host (its newest successful scan).
+    """
+    if filename is not None:
+        query = PORT_ROWS + (
+            " WHERE host_ports.filename = ? AND protocol = ? AND port = ?"
+            " AND state = ? ORDER BY host_ports.address"
+        )
+        params = (filename, protocol, port, state)
+    else:
+        query = PORT_ROWS + (
+            " JOIN current_hosts ON current_hosts.filename = host_ports.filename"
+            " AND current_hosts.address = host_ports.address"
+            " WHERE protocol = ? AND port = ? AND state = ?"
+            " ORDER BY host_ports.address"
+        )
+        params = (protocol, port, state)
+    conn = connect(results_dir)
+    try:
+        return [dict(row) for row in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+
+def previous_scan(results_dir, filename, target):
+    """Returns the newest successful scan of `target` older than `filename`, or None."""
+    conn = connect(results_dir)
+    try:
+        row = conn.execute(
+            "SELECT filename FROM scans WHERE scan_successful AND scan_target = ?"
+            " AND filename < ? ORDER BY filename DESC LIMIT 1",
+            (target, filename),
+        ).fetchone()
+        return row["filename"] if row else None
+    finally:
+        conn.close()
+
+
+def scan_durations(results_dir, target, limit, scan_mode="full"):
+    """
+    Returns (duration, host_count, scan_successful) of the newest `limit` scans
+    of `target` in `scan_mode` whose duration was recorded, newest first.
+    """
+    conn = connect(results_dir)
+    try:
+        rows = conn.execute(
+            "SELECT duration, host_count, scan_successful FROM scans"
+            " WHERE scan_target = ? AND COALESCE(scan_mode, 'full') = ?"
+            " AND duration IS NOT NULL"
+            " ORDER BY filename DESC LIMIT ?",
+            (target, scan_mode, limit),
+        )
+        return [tuple(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def has_scan(results_dir, filename):
+    conn = connect(results_dir)
+    try:
+        row = conn.execute(
+            "SELECT 1 FROM scans WHERE filename = ?", (filename,)
+        ).fetchone()
+        return row is not None
+    finally:
+        conn.close()
+
+
+def scan_hosts(results_dir, filename):
+    """Returns the set of host addresses reported by a scan."""
+    conn = connect(results_dir)
+    try:
+        rows = conn.execute("SELECT address FROM hosts WHERE filename = ?", (filename,))
+        return {row["address"] for row in rows}
+    finally:
+        conn.close()
+
+
+def scan_ports(results_dir, filename, state=None):
+    """Returns the ports reported by a scan, optionally only those in `state`."""
+    query = PORT_ROWS + " WHERE host_ports.filename = ?"
+    params = [filename]
+    if state is not None:
+        query += " AND state = ?"
+        params.append(state)
+    conn = connect(results_dir)
+    try:
+        return [dict(row) for row in conn.execute(query, params)]
+    finally:
+        conn.close()
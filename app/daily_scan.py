@@ -1,17 +1,45 @@
+import asyncio
+import ipaddress
 import time
 import subprocess
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import sys
-import json
-import xmltodict  # This script also requires: pip install xmltodict
+import tempfile
+
+from app import catalog, diff, incremental, jsonstream, retention, storage
+from app.hosts import HostIndexer, host_addresses
+from app.merge import merge_discovery, merge_documents, merge_xml_files
+from app.parser import NmapXmlParser, iter_nmap_hosts
+from app.runner import NMAP_TIMEOUT, stream_nmap
+from app.schedule import ScanSchedule, load_schedules
+from app.timing import TIMING_HISTORY, plan_timing
 
 # --- Configuration ---
 # Get scan target from environment variable, default to 'scanme.nmap.org' for a safe example
 SCAN_TARGET = os.environ.get("SCAN_TARGET", "scanme.nmap.org")
 # Get scan interval from environment variable, default to 24 hours
 SCAN_INTERVAL_HOURS = int(os.environ.get("SCAN_INTERVAL_HOURS", 24))
-SCAN_INTERVAL = SCAN_INTERVAL_HOURS * 60 * 60  # Convert hours to seconds
+# JSON file listing many targets, each with its own interval or cron schedule
+# (see app/schedule.py). When unset, SCAN_TARGET is scanned every SCAN_INTERVAL_HOURS.
+SCAN_TARGETS_FILE = os.environ.get("SCAN_TARGETS_FILE", "")
+# Maximum number of targets being scanned at the same time
+SCAN_MAX_TARGETS = int(os.environ.get("SCAN_MAX_TARGETS", 2))
+# Split a CIDR target into this many sub-ranges, each scanned by its own nmap process
+SCAN_SHARDS = int(os.environ.get("SCAN_SHARDS", 1))
+# Maximum number of shard nmap processes running at the same time
+SCAN_CONCURRENCY = int(os.environ.get("SCAN_CONCURRENCY", os.cpu_count() or 1))
+# Scheduler priority class of this scanner's nmap runs ("periodic" or "backfill")
+SCAN_PRIORITY = os.environ.get("SCAN_PRIORITY", "periodic")
+# When set, each scan first runs a fast host discovery pass (-sn) and port
+# scans the live hosts in batches of this size while discovery continues.
+# 0 port-scans the whole target in one pass.
+SCAN_DISCOVERY_BATCH_SIZE = int(os.environ.get("SCAN_DISCOVERY_BATCH_SIZE", 0))
+# A partial batch of live hosts is port-scanned after this many seconds
+# without a new one, instead of waiting for the batch to fill
+DISCOVERY_FLUSH_SECONDS = 5
+# Batch size for incremental scans when SCAN_DISCOVERY_BATCH_SIZE is 0
+DEFAULT_BATCH_SIZE = 16
 
 # Use an absolute path for the output directory
 OUTPUT_DIR = "/code/app/scan_results"
@@ -30,49 +58,366 @@ def ensure_output_dir_exists():
         sys.exit(1)
 
 
-def write_json_file(data, filename):
-    """Writes a Python dictionary to a JSON file."""
-    filepath = os.path.join(OUTPUT_DIR, filename)
-    with open(filepath, "w") as f:
-        json.dump(data, f, indent=4)
+def write_json_file(data, filename, duration=None):
+    """
+    Writes a Python dictionary to a JSON file. Iterator values are streamed as arrays.
+    `duration` is how long the scan took, recorded in the catalog for timing.
+    """
+    # In delta storage mode most scans are stored as changes against an earlier one
+    base, chain = storage.delta_base(OUTPUT_DIR, filename, data)
+    indexer = HostIndexer()
+    if base:
+        # The hash and host offsets refer to the full JSON text the API serves
+        data = storage.materialize(data)
+        writer = jsonstream.HashingWriter()
+        jsonstream.dump(data, writer, indent=4, on_value=indexer)
+        filepath = storage.write_delta(OUTPUT_DIR, filename, base, data)
+        stored_as = "delta"
+    else:
+        filepath = os.path.join(OUTPUT_DIR, filename)
+        # Write to a temporary name first so readers never see a half-written scan
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # Hash the content while writing it; the hash becomes the file's ETag.
+            # Record where each host lands too, for the per-host history index.
+            writer = jsonstream.HashingWriter(f)
+            jsonstream.dump(data, writer, indent=4, on_value=indexer)
+        os.replace(tmp_path, filepath)
+        stored_as = "full"
     print(f"Scan results saved to {filepath}")
+    try:
+        catalog.record_scan(
+            OUTPUT_DIR,
+            filename,
+            data,
+            writer.digest.hexdigest(),
+            indexer,
+            storage=stored_as,
+            base=base,
+            chain=chain,
+            duration=duration,
+        )
+        catalog.update_latest_pointers(
+            OUTPUT_DIR, filename, data.get("scan_successful", False), stored_as
+        )
+        if data.get("scan_successful"):
+            # Precompute "what changed since the last scan" for the API
+            changes = diff.store_diff(OUTPUT_DIR, filename, data.get("scan_target"))
+            if changes:
+                print(
+                    f"Changes since {changes['from']}: "
+                    f"{len(changes['hosts_appeared'])} hosts appeared, "
+                    f"{len(changes['hosts_disappeared'])} disappeared, "
+                    f"{len(changes['ports_opened'])} ports opened, "
+                    f"{len(changes['ports_closed'])} closed."
+                )
+    except Exception as e:
+        # The file is saved; the next catalog sync will pick it up
+        print(f"WARNING: Could not add {filename} to the catalog: {e}", file=sys.stderr)
 
 
-# --- Main Loop ---
-print("Starting periodic nmap scanner...")
-while True:
-    ensure_output_dir_exists()
+# Serializes writes to the results: saving scans, catalog syncs and retention
+catalog_writes = asyncio.Lock()
+
+
+async def save_scan(data, filename, started):
+    """
+    Writes a scan with write_json_file in a worker thread, which also consumes
+    the lazy host iterators of `data`, so other targets' scans keep running.
+    `started` is the scan's time.monotonic() start time.
+    """
+    duration = time.monotonic() - started
+    async with catalog_writes:
+        await asyncio.to_thread(write_json_file, data, filename, duration)
+
+
+async def sync_catalog():
+    """Adds scan files the catalog missed (e.g. after a failed catalog write) to it."""
+    async with catalog_writes:
+        try:
+            added = await asyncio.to_thread(catalog.sync_catalog, OUTPUT_DIR)
+        except Exception as e:
+            # Scanning doesn't depend on the catalog; keep going without it
+            print(f"WARNING: Could not sync the catalog: {e}", file=sys.stderr)
+            return
+    if added:
+        print(f"Added {added} scan files to the catalog.")
+
+
+def split_target(target, shards):
+    """
+    Splits a CIDR target into up to `shards` contiguous, equally sized sub-ranges.
+    Each shard is a list of CIDR blocks covering its range. Hostnames and other
+    targets that are not a network are returned as a single shard.
+    """
+    try:
+        network = ipaddress.ip_network(target, strict=False)
+    except ValueError:
+        return [[target]]
+
+    shards = max(1, min(shards, network.num_addresses))
+    if shards == 1:
+        return [[target]]
+
+    address = type(network.network_address)
+    first = int(network.network_address)
+    total = network.num_addresses
+    result = []
+    for i in range(shards):
+        start = address(first + total * i // shards)
+        end = address(first + total * (i + 1) // shards - 1)
+        result.append(
+            [str(block) for block in ipaddress.summarize_address_range(start, end)]
+        )
+    return result
+
+
+async def scan_shard(targets, semaphore, path, args=(), timeout=NMAP_TIMEOUT):
+    """Scans one shard, writing nmap's raw XML output to `path`."""
+    async with semaphore:
+        with open(path, "wb") as f:
+            async for chunk in stream_nmap(
+                targets, args, timeout, priority=SCAN_PRIORITY
+            ):
+                f.write(chunk)
+
+
+async def target_timing(target, processes, scan_mode="full", max_timeout=None):
+    """
+    Returns the nmap timing arguments and timeout for a scan of `target` (see
+    app/timing.py), judged by earlier scans of the same mode.
+    """
+    history = await asyncio.to_thread(
+        catalog.scan_durations, OUTPUT_DIR, target, TIMING_HISTORY, scan_mode
+    )
+    args, timeout = plan_timing(
+        target,
+        history,
+        processes=processes,
+        max_timeout=max_timeout,
+    )
+    if args or timeout != NMAP_TIMEOUT:
+        print(
+            f"Timing for {target}: {' '.join(args) or 'nmap defaults'}, timeout {timeout}s."
+        )
+    return args, timeout
+
+
+async def run_all(tasks):
+    """Waits for all tasks. If one fails, the others are cancelled and the error is raised."""
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def scan_target(target, shard_dir, max_timeout=None):
+    """
+    Scans `target` as SCAN_SHARDS shards, at most SCAN_CONCURRENCY at a time,
+    and returns the paths of the per-shard XML files in `shard_dir`, in target
+    order. If any shard fails, the others are cancelled and the error is raised.
+    nmap's timing is tuned from the target's previous scans (see app/timing.py).
+    """
+    shards = split_target(target, SCAN_SHARDS)
+    concurrency = max(1, SCAN_CONCURRENCY)
+    semaphore = asyncio.Semaphore(concurrency)
+    args, timeout = await target_timing(
+        target, min(len(shards), concurrency), max_timeout=max_timeout
+    )
+    paths = [os.path.join(shard_dir, f"shard_{i:04d}.xml") for i in range(len(shards))]
+    await run_all(
+        [
+            asyncio.create_task(scan_shard(targets, semaphore, path, args, timeout))
+            for targets, path in zip(shards, paths)
+        ]
+    )
+
+    if len(paths) > 1:
+        print(f"Merging results from {len(paths)} shards of {target}.")
+    return paths
+
+
+async def discover_shard(targets, semaphore, queue, timeout):
+    """
+    Runs a host discovery pass (-sn) over one shard, putting the address of
+    each live host on `queue` as soon as nmap reports it. Returns the parsed
+    discovery document (without hosts), for its host counts.
+    """
+    parser = NmapXmlParser()
+    async with semaphore:
+        chunks = stream_nmap(targets, ["-sn"], timeout, priority=SCAN_PRIORITY)
+        async for host in iter_nmap_hosts(parser, chunks):
+            addresses = host_addresses(host)
+            if addresses:
+                await queue.put(addresses[0])
+    return parser.document
+
+
+async def scan_target_in_phases(target, shard_dir, plan=None, max_timeout=None):
+    """
+    Scans `target` in two pipelined phases and returns the merged `nmaprun`
+    dictionary: host discovery over SCAN_SHARDS shards, and port scans (-Pn)
+    of the live hosts it finds, in batches. Port scanning starts with the
+    first full batch, while discovery is still running. SCAN_CONCURRENCY is
+    split between the two phases.
+
+    An incremental `plan` sorts the live hosts into groups that are batched
+    separately and port-scanned with their own arguments.
+    """
+    batch_size = SCAN_DISCOVERY_BATCH_SIZE or DEFAULT_BATCH_SIZE
+    shards = split_target(target, SCAN_SHARDS)
+    concurrency = max(1, SCAN_CONCURRENCY)
+    discovery_slots = asyncio.Semaphore(max(1, (concurrency + 1) // 2))
+    port_scan_slots = asyncio.Semaphore(max(1, concurrency // 2))
+    args, timeout = await target_timing(
+        target,
+        max(1, concurrency // 2),
+        "incremental" if plan else "full",
+        max_timeout,
+    )
+    queue = asyncio.Queue()
+
+    async def discover():
+        try:
+            return await asyncio.gather(
+                *(
+                    discover_shard(targets, discovery_slots, queue, timeout)
+                    for targets in shards
+                )
+            )
+        finally:
+            # Tell the batching loop that no more hosts are coming
+            queue.put_nowait(None)
+
+    discovery = asyncio.create_task(discover())
+    tasks = [discovery]
+    paths = []
+    # Live hosts waiting to be port-scanned, by group
+    batches = {}
+    found = 0
 
+    def port_scan(group):
+        batch = batches.pop(group)
+        extra = plan.arguments(group, batch) if plan else []
+        path = os.path.join(shard_dir, f"batch_{len(paths):04d}.xml")
+        paths.append(path)
+        tasks.append(
+            asyncio.create_task(
+                scan_shard(
+                    batch, port_scan_slots, path, ["-Pn", *extra, *args], timeout
+                )
+            )
+        )
+
+    try:
+        while True:
+            try:
+                address = await asyncio.wait_for(
+                    queue.get(), DISCOVERY_FLUSH_SECONDS if batches else None
+                )
+            except asyncio.TimeoutError:
+                for group in list(batches):
+                    port_scan(group)
+                continue
+            if address is None:
+                break
+            found += 1
+            group = plan.group(address) if plan else None
+            batches.setdefault(group, []).append(address)
+            if len(batches[group]) >= batch_size:
+                port_scan(group)
+        for group in list(batches):
+            port_scan(group)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    await run_all(tasks)
+
+    discovered = None
+    for document in discovery.result():
+        discovered = merge_documents(discovered, document)
+    print(
+        f"Discovery found {found} live hosts in {target}, port scanned in"
+        f" {len(paths)} batches."
+    )
+    # The first pass over the batch files parses them all; keep it off the loop
+    merged = await asyncio.to_thread(merge_xml_files, paths)
+    return merge_discovery(merged, discovered or {})
+
+
+_last_timestamp = None
+
+
+def next_timestamp():
+    """
+    Returns the timestamp for a new scan's filename (e.g., 2025-10-03_21-35-31).
+    Scans of different targets can start in the same second, so each call
+    returns a later second than the one before it.
+    """
+    global _last_timestamp
+    now = datetime.now().replace(microsecond=0)
+    if _last_timestamp is not None and now <= _last_timestamp:
+        now = _last_timestamp + timedelta(seconds=1)
+    _last_timestamp = now
+    return now.strftime("%Y-%m-%d_%H-%M-%S")
+
+
+async def run_scan(target=None, max_timeout=None):
+    """
+    Runs one scan of `target` (default SCAN_TARGET) and writes the result (or error) to OUTPUT_DIR.
+    `max_timeout` bounds each nmap run's timeout, e.g. to the target's interval.
+    """
+    target = target or SCAN_TARGET
     # Generate a timestamp for the filename (e.g., 2025-10-03_21-35-31)
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    timestamp = next_timestamp()
     now_iso = datetime.utcnow().isoformat() + "Z"  # Use UTC for logs
+    started = time.monotonic()
 
     try:
         print(
-            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Running nmap scan on {SCAN_TARGET}..."
+            f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Running nmap scan on {target}..."
         )
 
         # Run nmap with XML output to stdout ('-oX -')
         # This is more reliable than parsing plain text.
-        cmd = ["nmap", "-oX", "-", SCAN_TARGET]
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=300, check=True
-        )
+        # Each shard's output is kept on disk and merged host by host while the
+        # result file is written, so memory use does not grow with the scan.
+        # Between full scans, incremental mode only port-scans what is likely
+        # to have changed, judged by the target's previous results. Planning
+        # reads the catalog, so it runs off the event loop other targets share.
+        plan = await asyncio.to_thread(incremental.plan_scan, OUTPUT_DIR, target)
+        with tempfile.TemporaryDirectory(prefix="nmap_shards_") as shard_dir:
+            if plan is not None:
+                print(f"Running an incremental scan of {target}.")
+                nmap_data = await scan_target_in_phases(
+                    target, shard_dir, plan, max_timeout
+                )
+            elif SCAN_DISCOVERY_BATCH_SIZE > 0:
+                nmap_data = await scan_target_in_phases(
+                    target, shard_dir, max_timeout=max_timeout
+                )
+            else:
+                paths = await scan_target(target, shard_dir, max_timeout)
+                nmap_data = await asyncio.to_thread(merge_xml_files, paths)
 
-        # Convert Nmap's XML output to a Python dictionary
-        scan_data_dict = xmltodict.parse(result.stdout)
+            # Structure the final JSON output for successful scans
+            output_data = {
+                "scan_timestamp_utc": now_iso,
+                "scan_target": target,
+                "scan_successful": True,
+            }
+            if incremental.SCAN_FULL_EVERY > 1:
+                output_data["scan_mode"] = "full" if plan is None else "incremental"
+            output_data["nmap_data"] = nmap_data  # The root element
 
-        # Structure the final JSON output for successful scans
-        output_data = {
-            "scan_timestamp_utc": now_iso,
-            "scan_target": SCAN_TARGET,
-            "scan_successful": True,
-            "nmap_data": scan_data_dict.get("nmaprun", {}),  # Get the root element
-        }
-
-        # Write the successful scan data to a timestamped JSON file
-        filename = f"scan_{timestamp}.json"
-        write_json_file(output_data, filename)
+            # Write the successful scan data to a timestamped JSON file
+            filename = f"scan_{timestamp}.json"
+            await save_scan(output_data, filename, started)
 
     except subprocess.CalledProcessError as e:
         # This error occurs when nmap returns a non-zero exit code.
@@ -84,7 +429,7 @@ while True:
         # --- IMPROVED LOGGING ---
         # Log the detailed error to the server console for easier debugging
         error_message = e.stderr.strip() if e.stderr else "No stderr output from Nmap."
-        print(f"  Target: {SCAN_TARGET}", file=sys.stderr)
+        print(f"  Target: {target}", file=sys.stderr)
         print(f"  Nmap Stderr: {error_message}", file=sys.stderr)
         # --- END IMPROVED LOGGING ---
 
@@ -97,14 +442,14 @@ while True:
 
         output_data = {
             "scan_timestamp_utc": now_iso,
-            "scan_target": SCAN_TARGET,
+            "scan_target": target,
             "scan_successful": False,
             "error": error_details,
         }
 
         # Write the error data to a timestamped JSON file
         filename = f"scan_{timestamp}_error.json"
-        write_json_file(output_data, filename)
+        await save_scan(output_data, filename, started)
 
     except Exception as e:
         # Catch any other exceptions (e.g., timeout, parsing errors).
@@ -114,14 +459,83 @@ while True:
 
         output_data = {
             "scan_timestamp_utc": now_iso,
-            "scan_target": SCAN_TARGET,
+            "scan_target": target,
             "scan_successful": False,
             "error": error_details,
         }
 
         # Write the error data to a timestamped JSON file
         filename = f"scan_{timestamp}_error.json"
-        write_json_file(output_data, filename)
+        await save_scan(output_data, filename, started)
+
+
+# --- Scheduling ---
+def load_target_schedules():
+    """Returns the schedules from SCAN_TARGETS_FILE, or the single SCAN_TARGET one."""
+    if SCAN_TARGETS_FILE:
+        return load_schedules(SCAN_TARGETS_FILE)
+    return [ScanSchedule(SCAN_TARGET, interval_hours=SCAN_INTERVAL_HOURS)]
+
+
+def last_scan_time(target):
+    """Returns when `target` was last scanned (a Unix timestamp), according to the catalog."""
+    files, _ = catalog.list_scans(OUTPUT_DIR, limit=1, target=target)
+    if not files:
+        return None
+    when = retention.scan_time(catalog.scan_entry(OUTPUT_DIR, files[0]))
+    return when.timestamp() if when else None
+
+
+def apply_retention():
+    if retention.RETENTION_KEEP_ALL_DAYS or retention.RETENTION_ERROR_DAYS:
+        try:
+            retention.apply_retention(OUTPUT_DIR)
+        except Exception as e:
+            print(f"WARNING: Retention failed: {e}", file=sys.stderr)
+
+
+async def run_schedule(schedule, semaphore):
+    """Scans one target forever, at its scheduled times plus jitter."""
+    last_scan = await asyncio.to_thread(last_scan_time, schedule.target)
+    due = schedule.first_run(time.time(), last_scan)
+    while True:
+        start = due + schedule.jitter()
+        print(
+            f"Next scan of {schedule.target} ({schedule.describe()}) at "
+            f"{datetime.fromtimestamp(start).strftime('%Y-%m-%d %H:%M:%S')}."
+        )
+        await asyncio.sleep(max(0, start - time.time()))
+        async with semaphore:
+            await run_scan(schedule.target, schedule.interval)
+        await sync_catalog()
+        async with catalog_writes:
+            # Retention deletes scans, possibly the base a write is using
+            await asyncio.to_thread(apply_retention)
+        # Runs missed while this scan (or the wait for a free slot) took too
+        # long are skipped rather than run back to back
+        due = schedule.next_run(max(due, time.time()))
+
+
+async def run_schedules(schedules):
+    """Runs every target's schedule, scanning at most SCAN_MAX_TARGETS targets at once."""
+    semaphore = asyncio.Semaphore(max(1, SCAN_MAX_TARGETS))
+    # Pick up scan files the catalog missed, e.g. history from before it existed
+    await sync_catalog()
+    await asyncio.gather(*(run_schedule(schedule, semaphore) for schedule in schedules))
+
+
+# --- Main Loop ---
+def main():
+    print("Starting periodic nmap scanner...")
+    ensure_output_dir_exists()
+    try:
+        schedules = load_target_schedules()
+    except (OSError, ValueError) as e:
+        print(f"CRITICAL: Could not load the scan targets: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    asyncio.run(run_schedules(schedules))
+
 
-    print(f"Next scan in {SCAN_INTERVAL_HOURS} hours.")
-    time.sleep(SCAN_INTERVAL)
+if __name__ == "__main__":
+    main()
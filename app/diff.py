@@ -0,0 +1,91 @@
+import json
+import os
+
+from app import catalog
+
+# Precomputed diffs are stored here, named after the newer scan
+DIFFS_SUBDIR = "diffs"
+
+SERVICE_FIELDS = ("service", "product", "version")
+
+
+def diff_path(results_dir, filename):
+    return os.path.join(results_dir, DIFFS_SUBDIR, filename)
+
+
+def diff_scans(results_dir, from_filename, to_filename):
+    """
+    Compares two catalogued scans using the host and port indexes, without
+    reading either scan file. Port and service changes are reported for hosts
+    present in both scans; other hosts are listed as appeared or disappeared.
+    """
+    from_hosts = catalog.scan_hosts(results_dir, from_filename)
+    to_hosts = catalog.scan_hosts(results_dir, to_filename)
+    from_ports = _open_ports(results_dir, from_filename)
+    to_ports = _open_ports(results_dir, to_filename)
+    common = from_hosts & to_hosts
+
+    opened = []
+    closed = []
+    changed = []
+    for key in sorted(set(from_ports) | set(to_ports)):
+        if key[0] not in common:
+            continue
+        before = from_ports.get(key)
+        after = to_ports.get(key)
+        if before is None:
+            opened.append(after)
+        elif after is None:
+            closed.append(before)
+        elif any(before[field] != after[field] for field in SERVICE_FIELDS):
+            changed.append(
+                {
+                    "address": key[0],
+                    "protocol": key[1],
+                    "port": key[2],
+                    "from": {field: before[field] for field in SERVICE_FIELDS},
+                    "to": {field: after[field] for field in SERVICE_FIELDS},
+                }
+            )
+
+    return {
+        "from": from_filename,
+        "to": to_filename,
+        "hosts_appeared": sorted(to_hosts - from_hosts),
+        "hosts_disappeared": sorted(from_hosts - to_hosts),
+        "ports_opened": opened,
+        "ports_closed": closed,
+        "services_changed": changed,
+    }
+
+
+def _open_ports(results_dir, filename):
+    ports = {}
+    for row in catalog.scan_ports(results_dir, filename, state="open"):
+        ports[(row["address"], row["protocol"], row["port"])] = {
+            "address": row["address"],
+            "protocol": row["protocol"],
+            "port": row["port"],
+            **{field: row[field] for field in SERVICE_FIELDS},
+        }
+    return ports
+
+
+def store_diff(results_dir, to_filename, target):
+    """
+    Computes the diff between `to_filename` and the previous successful scan
+    of the same target and stores it next to the results. Returns the diff, or
+    None if there is no earlier scan to compare with.
+    """
+    from_filename = catalog.previous_scan(results_dir, to_filename, target)
+    if from_filename is None:
+        return None
+
+    diff = diff_scans(results_dir, from_filename, to_filename)
+    path = diff_path(results_dir, to_filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(diff, f)
+    os.replace(tmp_path, path)
+    return diff
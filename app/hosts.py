@@ -0,0 +1,88 @@
+def as_list(value):
+    """nmap elements that can repeat are a dict when single and a list otherwise."""
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def host_addresses(host):
+    """Returns the IPv4/IPv6 addresses of a host record (MAC addresses are skipped)."""
+    return [
+        address["@addr"]
+        for address in as_list(host.get("address"))
+        if isinstance(address, dict)
+        and address.get("@addrtype") in ("ipv4", "ipv6")
+        and address.get("@addr")
+    ]
+
+
+def host_ports(host):
+    """Returns the probed ports of a host record as flat dictionaries."""
+    ports = []
+    for port in as_list((host.get("ports") or {}).get("port")):
+        service = port.get("service") or {}
+        ports.append(
+            {
+                "protocol": port.get("@protocol"),
+                "port": int(port.get("@portid", 0)),
+                "state": (port.get("state") or {}).get("@state"),
+                "service": service.get("@name"),
+                "product": service.get("@product"),
+                "version": service.get("@version"),
+            }
+        )
+    return ports
+
+
+def host_summary(host):
+    """Returns a compact summary of a host record: state, hostnames and ports."""
+    return {
+        "addresses": host_addresses(host),
+        "state": (host.get("status") or {}).get("@state"),
+        "hostnames": [
+            hostname.get("@name")
+            for hostname in as_list((host.get("hostnames") or {}).get("hostname"))
+            if isinstance(hostname, dict)
+        ],
+        "ports": host_ports(host),
+    }
+
+
+class HostIndexer:
+    """
+    An `on_value` callback for jsonstream.dump that records where each host of
+    a scan document starts and ends in the written file, by address, along
+    with every port reported for it.
+    """
+
+    def __init__(self):
+        # (address, offset, length) for every host written
+        self.rows = []
+        # (address, protocol, port, state, service, product, version) for every port
+        self.ports = []
+
+    def __call__(self, path, value, start, end):
+        is_single_host = path == ("nmap_data", "host")
+        is_listed_host = (
+            len(path) == 3
+            and path[:2] == ("nmap_data", "host")
+            and isinstance(path[2], int)
+        )
+        if (is_single_host or is_listed_host) and isinstance(value, dict):
+            ports = host_ports(value)
+            for address in host_addresses(value):
+                self.rows.append((address, start, end - start))
+                self.ports.extend(
+                    (
+                        address,
+                        port["protocol"],
+                        port["port"],
+                        port["state"],
+                        port["service"],
+                        port["product"],
+                        port["version"],
+                    )
+                    for port in ports
+                )
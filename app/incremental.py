@@ -0,0 +1,88 @@
+import json
+import os
+
+from app import catalog, diff
+
+# --- Configuration ---
+# Run a full scan of the target every this many scans and incremental scans in
+# between. 0 (the default) makes every scan a full one.
+SCAN_FULL_EVERY = int(os.environ.get("SCAN_FULL_EVERY", 0))
+# Hosts not seen in this many recent scans only get the cheap liveness probe
+SCAN_DOWN_SCANS = int(os.environ.get("SCAN_DOWN_SCANS", 3))
+
+# Common TCP ports always probed on known hosts, on top of the ports they had
+# open recently, so services appearing on them are noticed between full scans
+INCREMENTAL_PORTS = (
+    "21,22,23,25,53,80,110,111,135,139,143,443,445,993,995," "1723,3306,3389,5900,8080"
+)
+
+
+class IncrementalPlan:
+    """
+    How an incremental scan treats the live hosts its discovery pass finds:
+    hosts seen in the last SCAN_DOWN_SCANS scans are port-scanned on their
+    recently open ports plus INCREMENTAL_PORTS; any other host is new or back
+    after being down, and gets a full port scan.
+    """
+
+    def __init__(self, known_ports):
+        # address -> TCP ports it had open in recent scans
+        self.known_ports = known_ports
+
+    def group(self, address):
+        return "known" if address in self.known_ports else "new"
+
+    def arguments(self, group, addresses):
+        """Returns the extra nmap arguments for a batch of hosts of one group."""
+        if group == "new":
+            return []
+        ports = {int(port) for port in INCREMENTAL_PORTS.split(",")}
+        for address in addresses:
+            ports |= self.known_ports[address]
+        return ["-p", ",".join(str(port) for port in sorted(ports))]
+
+
+def previous_changes(results_dir, filename):
+    """True if the stored diff of a scan against the one before it shows any change."""
+    path = diff.diff_path(results_dir, filename)
+    if not os.path.isfile(path):
+        return False
+    with open(path, "r") as f:
+        changes = json.load(f)
+    return any(changes[key] for key in changes if key not in ("from", "to"))
+
+
+def plan_scan(results_dir, target, full_every=None, down_scans=None):
+    """
+    Decides from the target's previous scans whether the next one can be
+    incremental. Returns an IncrementalPlan, or None when a full scan is due:
+    incremental mode is off, there is no full scan in the last `full_every`
+    - 1 scans, or the last scan found changes. `full_every` and `down_scans`
+    default to the current SCAN_FULL_EVERY and SCAN_DOWN_SCANS.
+    """
+    if full_every is None:
+        full_every = SCAN_FULL_EVERY
+    if down_scans is None:
+        down_scans = SCAN_DOWN_SCANS
+    if full_every <= 1:
+        return None
+    recent, _ = catalog.list_scans(
+        results_dir,
+        limit=max(full_every - 1, down_scans, 1),
+        target=target,
+        successful=True,
+    )
+    if not recent or previous_changes(results_dir, recent[0]):
+        return None
+    modes = [catalog.scan_entry(results_dir, f)["scan_mode"] for f in recent]
+    if all(mode == "incremental" for mode in modes[: full_every - 1]):
+        return None
+
+    known_ports = {}
+    for filename in recent[:down_scans]:
+        for address in catalog.scan_hosts(results_dir, filename):
+            known_ports.setdefault(address, set())
+        for row in catalog.scan_ports(results_dir, filename, state="open"):
+            if row["protocol"] == "tcp" and row["address"] in known_ports:
+                known_ports[row["address"]].add(row["port"])
+    return IncrementalPlan(known_ports)
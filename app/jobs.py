@@ -0,0 +1,97 @@
+import asyncio
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+# --- Configuration ---
+# Maximum number of jobs (running and finished) kept in memory at once
+MAX_SCAN_JOBS = int(os.environ.get("MAX_SCAN_JOBS", 100))
+
+
+class JobRegistryFull(Exception):
+    """Raised when every slot in the registry is held by an unfinished job."""
+
+
+class ScanJob:
+    """A single on-demand scan tracked by the job registry."""
+
+    def __init__(self, target, arguments):
+        self.id = uuid.uuid4().hex
+        self.target = target
+        self.arguments = arguments
+        self.status = "queued"
+        self.created_utc = datetime.utcnow().isoformat() + "Z"
+        self.started_utc = None
+        self.finished_utc = None
+        self.result = None
+        self.error = None
+        self.task = None
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "failed")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "target": self.target,
+            "arguments": self.arguments,
+            "created_utc": self.created_utc,
+            "started_utc": self.started_utc,
+            "finished_utc": self.finished_utc,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobRegistry:
+    """
+    A bounded, in-process registry of scan jobs.
+    When full, the oldest finished job is evicted to make room for a new one.
+    All methods must be called from the event loop thread.
+    """
+
+    def __init__(self, max_jobs=MAX_SCAN_JOBS):
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def submit(self, target, arguments, run, describe_error):
+        """
+        Registers a new job and schedules `run()` (a coroutine function returning
+        the scan result) on the running event loop. Exceptions raised by `run` are
+        converted into the job's error with `describe_error(e)`.
+        """
+        self._make_room()
+        job = ScanJob(target, arguments)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, run, describe_error))
+        return job
+
+    async def _run(self, job, run, describe_error):
+        job.status = "running"
+        job.started_utc = datetime.utcnow().isoformat() + "Z"
+        try:
+            job.result = await run()
+            job.status = "completed"
+        except Exception as e:
+            job.error = describe_error(e)
+            job.status = "failed"
+        finally:
+            job.finished_utc = datetime.utcnow().isoformat() + "Z"
+            job.task = None
+
+    def _make_room(self):
+        if len(self.jobs) < self.max_jobs:
+            return
+        for job_id, job in self.jobs.items():
+            if job.finished:
+                del self.jobs[job_id]
+                return
+        raise JobRegistryFull(
+            f"All {self.max_jobs} job slots are held by unfinished scans."
+        )
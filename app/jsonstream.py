@@ -0,0 +1,82 @@
+import hashlib
+import json
+
+
+def dump(obj, fp, indent=4, on_value=None):
+    """
+    Writes `obj` as JSON to a text file, like `json.dump(obj, fp, indent=indent)`,
+    except that iterators and generators are written out element by element as
+    JSON arrays. This lets a scan document hold a lazy host iterator and still be
+    saved without materialising every host in memory.
+
+    If given, `on_value(path, value, start, end)` is called after each object
+    member and each array element is written, with the key/index path to it and
+    the character offsets of its JSON text. Output is ASCII, so these are also
+    byte offsets. Values inside array elements are not reported individually.
+    """
+    _Writer(fp, indent, on_value).write(obj, (), 0)
+
+
+class _Writer:
+    def __init__(self, fp, indent, on_value):
+        self.fp = fp
+        self.indent = indent
+        self.on_value = on_value
+        self.position = 0
+
+    def emit(self, text):
+        self.fp.write(text)
+        self.position += len(text)
+
+    def dumps(self, value, level):
+        # Re-indent a nested value so it lines up with its position in the document
+        return json.dumps(value, indent=self.indent).replace(
+            "\n", "\n" + " " * (self.indent * level)
+        )
+
+    def write(self, obj, path, level):
+        inner = "\n" + " " * (self.indent * (level + 1))
+        if isinstance(obj, dict):
+            if not obj:
+                self.emit("{}")
+                return
+            separator = "{"
+            for key, value in obj.items():
+                self.emit(separator + inner + json.dumps(str(key)) + ": ")
+                start = self.position
+                self.write(value, path + (key,), level + 1)
+                if self.on_value:
+                    self.on_value(path + (key,), value, start, self.position)
+                separator = ","
+            self.emit("\n" + " " * (self.indent * level) + "}")
+        elif isinstance(obj, (str, int, float, bool)) or obj is None:
+            self.emit(self.dumps(obj, level))
+        else:
+            separator = "["
+            for index, value in enumerate(obj):
+                self.emit(separator + inner)
+                start = self.position
+                self.emit(self.dumps(value, level + 1))
+                if self.on_value:
+                    self.on_value(path + (index,), value, start, self.position)
+                separator = ","
+            if separator == "[":
+                self.emit("[]")
+            else:
+                self.emit("\n" + " " * (self.indent * level) + "]")
+
+
+class HashingWriter:
+    """
+    Hashes everything written through it with SHA-256, passing it on to a text
+    file if one is given.
+    """
+
+    def __init__(self, f=None):
+        self.f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, text):
+        self.digest.update(text.encode())
+        if self.f is not None:
+            self.f.write(text)
@@ -1,13 +1,25 @@
-from fastapi import FastAPI, HTTPException, Response
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
+import asyncio
 import subprocess
 import os
 import json
-from typing import List
+import ipaddress
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 
-# This library is now a dependency for the API as well
-# You can install it with: pip install xmltodict
-import xmltodict
+from app import catalog, diff, retention, scheduler, storage
+from app.admission import AdmissionFull, ScanAdmission
+from app.hosts import host_summary
+from app.jobs import JobRegistry, JobRegistryFull
+from app.parser import NmapXmlParser, iter_nmap_hosts, parse_nmap_stream
+from app.runner import stream_nmap
+from app.scancache import ScanResultCache
+from app.singleflight import SingleFlight, scan_key
 
 app = FastAPI(
     title="Nmap Results API",
@@ -18,6 +30,168 @@ app = FastAPI(
 # --- Configuration ---
 # This must match the OUTPUT_DIR in your background scanner script
 RESULTS_DIR = "/code/app/scan_results"
+# Memory budget for cached result files, in bytes
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", 64 * 1024 * 1024))
+# Larger files are not cached; they are streamed from disk instead
+RESULT_CACHE_MAX_FILE_BYTES = int(
+    os.environ.get("RESULT_CACHE_MAX_FILE_BYTES", 1024 * 1024)
+)
+# Scans rebuilt from deltas cannot be streamed from disk, so larger ones are
+# cached too: rebuilding one costs far more than reading a file
+RESULT_CACHE_MAX_REBUILT_BYTES = int(
+    os.environ.get("RESULT_CACHE_MAX_REBUILT_BYTES", 16 * 1024 * 1024)
+)
+
+
+class ResultCache:
+    """
+    A bounded LRU cache of result file contents, keyed by (filename, mtime, size).
+    A file whose mtime or size changes is simply read again. Files larger than
+    `max_file_bytes` are never cached. Other content, such as scans rebuilt
+    from deltas, can be cached under any key with `get`.
+    """
+
+    def __init__(self, max_bytes, max_file_bytes):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = min(max_file_bytes, max_bytes)
+        self.entries = OrderedDict()  # key -> (version, content)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def read(self, path):
+        """
+        Returns the file's bytes, from memory if they are cached and current.
+        Returns None, without reading the file, if it is too large to cache.
+        """
+        stat = os.stat(path)
+        if stat.st_size > self.max_file_bytes:
+            return None
+
+        def load():
+            with open(path, "rb") as f:
+                return f.read()
+
+        return self.get(path, (stat.st_mtime_ns, stat.st_size), load)
+
+    def get(self, key, version, load, max_size=None):
+        """
+        Returns the bytes cached under `key` if they were stored with the same
+        `version`; otherwise calls `load()` and caches its result if it fits.
+        `max_size` overrides `max_file_bytes` (up to the whole budget).
+        """
+        max_size = min(max_size or self.max_file_bytes, self.max_bytes)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        content = load()
+
+        with self.lock:
+            self._remove(key)
+            if len(content) <= max_size:
+                self.entries[key] = (version, content)
+                self.bytes += len(content)
+                while self.bytes > self.max_bytes:
+                    self._remove(next(iter(self.entries)))
+        return content
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.bytes -= len(entry[1])
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "max_file_bytes": self.max_file_bytes,
+            }
+
+
+result_cache = ResultCache(RESULT_CACHE_BYTES, RESULT_CACHE_MAX_FILE_BYTES)
+
+
+def is_not_modified(request: Request, etag: str, mtime: float):
+    """Evaluates If-None-Match (preferred) or If-Modified-Since against a file."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def serve_scan(filename: str, request: Request, immutable: bool = True):
+    """
+    Serves a scan as JSON. Small files come from the result cache; large
+    files and Range requests are streamed from disk by FileResponse, which sets
+    Content-Length and answers byte ranges without loading the file into memory.
+    Delta-stored scans are rebuilt (and cached) and always sent in full.
+
+    Responses carry a strong ETag (the content hash stored in the catalog) and
+    Last-Modified, and conditional requests get an empty 304. Scan files never
+    change once written, so they are marked immutable; pass `immutable=False`
+    for URLs whose target moves, such as /results/latest. Files the catalog
+    missed are catalogued first, so they are hashed only once.
+    """
+    catalog.ensure_catalog(RESULTS_DIR)
+    entry = catalog.scan_entry(RESULTS_DIR, filename)
+    if entry is None and os.path.isfile(os.path.join(RESULTS_DIR, filename)):
+        entry = catalog.add_scan_file(RESULTS_DIR, filename)
+    immutable = immutable and entry is not None
+    stored_as = entry["storage"] if entry else "full"
+    path = catalog.stored_path(RESULTS_DIR, filename, stored_as)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found.")
+
+    mtime = os.stat(path).st_mtime
+    sha256 = entry["sha256"] or catalog.scan_sha256(RESULTS_DIR, filename)
+    etag = '"' + sha256 + '"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": (
+            "public, max-age=31536000, immutable" if immutable else "no-cache"
+        ),
+    }
+    if is_not_modified(request, etag, mtime):
+        return Response(status_code=304, headers=headers)
+
+    if stored_as == "delta":
+        content = result_cache.get(
+            ("delta", filename),
+            sha256,
+            lambda: storage.load_bytes(RESULTS_DIR, filename),
+            RESULT_CACHE_MAX_REBUILT_BYTES,
+        )
+        return Response(content=content, media_type="application/json", headers=headers)
+
+    if "range" not in request.headers:
+        content = result_cache.read(path)
+        if content is not None:
+            return Response(
+                content=content,
+                media_type="application/json",
+                headers={**headers, "Accept-Ranges": "bytes"},
+            )
+    return FileResponse(path, media_type="application/json", headers=headers)
 
 
 # Pydantic model for the request body of the on-demand scan
@@ -33,11 +207,132 @@ def index():
     return {"message": "Nmap Results API is running."}
 
 
+@app.get("/cache/stats", summary="Result Cache Statistics", tags=["General"])
+def get_cache_stats():
+    """Returns hit and miss counters and the memory use of the result file cache."""
+    return result_cache.stats()
+
+
+# Registry of scans started with `POST /scan?wait=false`
+scan_jobs = JobRegistry()
+
+
+# Identical on-demand scans running at the same time share one nmap process
+scan_flights = SingleFlight()
+# Recent on-demand scan results, reused by requests that pass `max_age`
+scan_cache = ScanResultCache()
+# Limits how many on-demand nmap processes run at once
+scan_admission = ScanAdmission()
+
+
+def queue_full_error(e: AdmissionFull):
+    return HTTPException(
+        status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def cached_scan(target: str, args: List[str], max_age: float):
+    """
+    Returns (result, age in seconds) of the newest scan of `target` with `args`
+    at most `max_age` seconds old, or None. Scans made by the periodic scanner
+    count too, for requests with nmap's default arguments like the scanner's.
+    """
+    key = scan_key(target, args)
+    best = scan_cache.get(key, max_age)
+    if args or not os.path.isdir(RESULTS_DIR):
+        return best
+    # Reading the catalog and a scan file blocks; keep it off the event loop
+    stored = await asyncio.to_thread(stored_scan, key, max_age)
+    if stored is not None and (best is None or stored[1] < best[1]):
+        best = stored
+    return best
+
+
+def stored_scan(key, max_age: float):
+    """Returns (result, age in seconds) of the periodic scanner's newest scan matching `key`, or None."""
+    since = datetime.now(timezone.utc) - timedelta(seconds=max_age)
+    catalog.ensure_catalog(RESULTS_DIR)
+    newest = None
+    for entry in catalog.latest_scans_by_target(
+        RESULTS_DIR, to_catalog_timestamp(since)
+    ):
+        when = retention.scan_time(entry)
+        if entry["scan_target"] is None or when is None:
+            continue
+        if scan_key(entry["scan_target"], ()) != key:
+            continue
+        age = max(0.0, (datetime.now(timezone.utc) - when).total_seconds())
+        if age <= max_age and (newest is None or age < newest[1]):
+            newest = (entry["filename"], age)
+    if newest is None:
+        return None
+    # Not kept in the document cache, which holds the keyframes deltas build on
+    document = storage.load_document(RESULTS_DIR, newest[0], cache=False)
+    return {"nmaprun": document["nmap_data"]}, newest[1]
+
+
+async def run_scan(target: str, args: List[str], max_age: Optional[float] = None):
+    """
+    Runs nmap against a target and returns its XML output as a dictionary.
+    With `max_age`, a cached result at most that many seconds old is returned
+    instead when there is one.
+    """
+    if max_age is not None:
+        cached = await cached_scan(target, args, max_age)
+        if cached is not None:
+            return cached[0]
+
+    key = scan_key(target, args)
+
+    async def run():
+        async with scan_admission.slot():
+            # Parse the XML output incrementally as nmap produces it
+            result = await parse_nmap_stream(stream_nmap(target, args))
+        scan_cache.put(key, result)
+        return result
+
+    return await scan_flights.do(key, run)
+
+
+def describe_scan_error(e: Exception):
+    """Converts an exception raised by a scan into a JSON-serializable error."""
+    if isinstance(e, AdmissionFull):
+        return {
+            "error_type": "QueueFull",
+            "message": str(e),
+            "retry_after": e.retry_after,
+        }
+    if isinstance(e, subprocess.CalledProcessError):
+        # This error is raised when nmap returns a non-zero exit code (e.g., target down)
+        return {
+            "error_type": "NmapExecutionError",
+            "message": "Nmap command failed.",
+            "return_code": e.returncode,
+            "stdout": e.stdout,
+            "stderr": e.stderr,
+        }
+    # Any other exception (e.g., timeout)
+    return {"error_type": "ScriptError", "message": str(e)}
+
+
 @app.post("/scan", summary="Run an On-Demand Scan", tags=["Scanning"])
-def scan(request: ScanRequest):
+async def scan(
+    request: ScanRequest,
+    response: Response,
+    wait: bool = True,
+    max_age: Optional[float] = Query(None, ge=0),
+):
     """
     Triggers a new Nmap scan immediately.
-    This scan is synchronous and returns structured JSON output upon completion.
+    By default the scan is synchronous and returns structured JSON output upon completion.
+    Requests for the same target and arguments made while such a scan is
+    running wait for it and share its result instead of starting another.
+    With `wait=false` the scan runs in the background and a job id is returned
+    right away; poll `GET /scans/{job_id}` for its status and results.
+
+    At most MAX_RUNNING_SCANS scans run at once and up to MAX_QUEUED_SCANS
+    more wait for a slot. Beyond that the request is refused with a 429 and a
+    `Retry-After` header; see `GET /scans/queue`.
     """
     # Basic input validation to prevent command injection
     # Splitting arguments helps ensure they are treated as separate flags
@@ -45,34 +340,119 @@ def scan(request: ScanRequest):
     if not request.target:
         raise HTTPException(status_code=400, detail="Scan target cannot be empty.")
 
+    if not wait:
+        try:
+            # Refuse now rather than queue a job that would fail; scans that
+            # can be answered from the cache or join a running one need no slot
+            cached = max_age is not None and await cached_scan(
+                request.target, args, max_age
+            )
+            if not cached and scan_key(request.target, args) not in scan_flights.calls:
+                scan_admission.check()
+            job = scan_jobs.submit(
+                request.target,
+                request.arguments,
+                lambda: run_scan(request.target, args, max_age),
+                describe_scan_error,
+            )
+        except AdmissionFull as e:
+            raise queue_full_error(e)
+        except JobRegistryFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        response.status_code = 202
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": f"/scans/{job.id}",
+        }
+
     try:
-        # Use nmap's XML output ('-oX -') which is reliable to parse
-        cmd = ["nmap", "-oX", "-"] + args + [request.target]
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=300, check=True
-        )
+        if max_age is not None:
+            cached = await cached_scan(request.target, args, max_age)
+            if cached is not None:
+                response.headers["Age"] = str(int(cached[1]))
+                return cached[0]
+        return await run_scan(request.target, args)
+    except AdmissionFull as e:
+        raise queue_full_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=describe_scan_error(e))
 
-        # Convert the XML output to a dictionary
-        scan_data_dict = xmltodict.parse(result.stdout)
-        return scan_data_dict
 
-    except subprocess.CalledProcessError as e:
-        # This error is raised when nmap returns a non-zero exit code (e.g., target down)
-        raise HTTPException(
-            status_code=500,
-            detail={
-                "error_type": "NmapExecutionError",
-                "message": "Nmap command failed.",
-                "return_code": e.returncode,
-                "stdout": e.stdout,
-                "stderr": e.stderr,
-            },
-        )
+@app.post("/scan/stream", summary="Stream an On-Demand Scan", tags=["Scanning"])
+async def scan_stream(request: ScanRequest):
+    """
+    Runs a new Nmap scan and streams the results as newline-delimited JSON.
+    Each completed host is sent as soon as nmap finishes it as
+    `{"type": "host", "host": {...}}`. The last line is either
+    `{"type": "summary", "host_count": N, "nmap_data": {...}}` (the scan
+    document without its hosts) or `{"type": "error", "error": {...}}`.
+    """
+    args = request.arguments.split()
+    if not request.target:
+        raise HTTPException(status_code=400, detail="Scan target cannot be empty.")
+    try:
+        scan_admission.check()
+    except AdmissionFull as e:
+        raise queue_full_error(e)
+
+    async def generate():
+        parser = NmapXmlParser()
+        try:
+            async with scan_admission.slot():
+                async for host in iter_nmap_hosts(
+                    parser, stream_nmap(request.target, args)
+                ):
+                    yield json.dumps({"type": "host", "host": host}) + "\n"
+        except Exception as e:
+            # The response has already started, so report the failure in-band
+            yield json.dumps({"type": "error", "error": describe_scan_error(e)}) + "\n"
+            return
+
+        nmap_data = parser.assemble(None)
+        nmap_data.pop("host", None)
+        summary = {
+            "type": "summary",
+            "host_count": parser.host_count,
+            "nmap_data": nmap_data,
+        }
+        yield json.dumps(summary) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.get("/scans/queue", summary="On-Demand Scan Queue", tags=["Scanning"])
+def get_scan_queue():
+    """
+    Returns how many on-demand scans are running and queued, the limits, and
+    an estimate of how long a new scan would wait for a slot. `workers` shows
+    the nmap worker slots shared with the periodic scanner, by priority class.
+    """
+    try:
+        workers = scheduler.status()
     except Exception as e:
-        # Catch any other exception (e.g., timeout)
-        raise HTTPException(
-            status_code=500, detail={"error_type": "ScriptError", "message": str(e)}
-        )
+        workers = {"error": str(e)}
+    return {**scan_admission.stats(), "workers": workers}
+
+
+@app.get("/scans/{job_id}", summary="Get On-Demand Scan Job", tags=["Scanning"])
+def get_scan_job(job_id: str):
+    """
+    Returns the status of a background scan job, and its results once finished.
+    """
+    job = scan_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Scan job not found.")
+    return job.to_dict()
+
+
+def to_catalog_timestamp(value: Optional[datetime]):
+    """Formats a query datetime like the scanner's scan_timestamp_utc, to the second."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%dT%H:%M:%S")
 
 
 @app.get(
@@ -81,63 +461,208 @@ def scan(request: ScanRequest):
     response_model=List[str],
     tags=["Results"],
 )
-def get_all_results():
+def get_all_results(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    target: Optional[str] = None,
+    successful: Optional[bool] = None,
+):
     """
     Returns a list of all available scan result filenames, sorted newest to oldest.
+
+    - `limit`: return at most this many filenames. When more exist, the
+      `X-Next-Cursor` response header holds the value to pass as `cursor`
+      to fetch the next page.
+    - `since` / `until`: only scans whose timestamp is at or after `since`
+      and before `until` (UTC unless an offset is given).
+    - `target`: only scans of exactly this target.
+    - `successful`: only successful (`true`) or failed (`false`) scans.
     """
     if not os.path.isdir(RESULTS_DIR):
         # If the directory doesn't exist yet, return an empty list.
         return []
     try:
-        # Filter for .json files, sort descending to show newest first
-        files = sorted(
-            [f for f in os.listdir(RESULTS_DIR) if f.endswith(".json")],
-            reverse=True,
+        # Answered from the scan catalog rather than by listing the directory
+        catalog.ensure_catalog(RESULTS_DIR)
+        files, next_cursor = catalog.list_scans(
+            RESULTS_DIR,
+            limit=limit,
+            cursor=cursor,
+            since=to_catalog_timestamp(since),
+            until=to_catalog_timestamp(until),
+            target=target,
+            successful=successful,
         )
-        return files
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return files
+
 
 @app.get("/results/latest", summary="Get Latest Scan Result", tags=["Results"])
-def get_latest_result():
+def get_latest_result(request: Request, successful: bool = False):
     """
     Retrieves the full JSON content of the most recent scan.
+    With `successful=true`, the most recent scan that did not fail.
+    The file is served as-is from the scanner's latest-result pointer.
     """
-    files = get_all_results()  # Reuse the logic from the other endpoint
-    if not files:
+    filename = None
+    if os.path.isdir(RESULTS_DIR):
+        try:
+            filename = catalog.resolve_latest(RESULTS_DIR, successful)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    if not filename:
         raise HTTPException(status_code=404, detail="No scan results found.")
 
-    latest_file_path = os.path.join(RESULTS_DIR, files[0])
-
     try:
-        with open(latest_file_path, "r") as f:
-            content = json.load(f)
-        return content
+        return serve_scan(filename, request, immutable=False)
+    except HTTPException:
+        raise
     except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not read file: {str(e)}")
+
+
+def check_filename(filename: str):
+    """Rejects anything but the plain filename of a scan inside RESULTS_DIR."""
+    # Security: Prevent directory traversal attacks
+    if ".." in filename or "/" in filename or not filename.endswith(".json"):
+        raise HTTPException(status_code=400, detail="Invalid or malicious filename.")
+    # The latest pointers move; they are served by /results/latest instead
+    if not catalog.is_scan_file(filename):
         raise HTTPException(
-            status_code=500, detail=f"Could not read or parse file: {str(e)}"
+            status_code=400,
+            detail=f"{filename} is not a scan file; use /results/latest.",
         )
 
 
 @app.get("/results/{filename}", summary="Get a Specific Scan Result", tags=["Results"])
-def get_specific_result(filename: str):
+def get_specific_result(filename: str, request: Request):
     """
     Retrieves the full JSON content of a specific scan by its filename.
     The filename must end in '.json'.
     """
-    # Security: Prevent directory traversal attacks
-    if ".." in filename or "/" in filename or not filename.endswith(".json"):
-        raise HTTPException(status_code=400, detail="Invalid or malicious filename.")
+    check_filename(filename)
 
-    file_path = os.path.join(RESULTS_DIR, filename)
+    try:
+        # Serve the file directly with the correct media type
+        return serve_scan(filename, request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not read file: {str(e)}")
 
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found.")
+
+@app.get("/hosts/{ip}/history", summary="Get a Host's Scan History", tags=["Hosts"])
+def get_host_history(ip: str, limit: Optional[int] = Query(None, ge=1, le=1000)):
+    """
+    Returns the state, hostnames and ports of one host in every scan that
+    reported it, newest first. Only that host's record is read from each scan.
+    """
+    try:
+        address = ipaddress.ip_address(ip).compressed
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid IP address.")
+
+    history = []
+    if os.path.isdir(RESULTS_DIR):
+        try:
+            catalog.ensure_catalog(RESULTS_DIR)
+            for entry in catalog.host_history(RESULTS_DIR, address, limit):
+                host = storage.read_host_record(
+                    RESULTS_DIR,
+                    entry["filename"],
+                    entry["position"],
+                    entry["length"],
+                    address,
+                )
+                summary = host_summary(host)
+                del summary["addresses"]
+                history.append(
+                    {
+                        "filename": entry["filename"],
+                        "scan_timestamp_utc": entry["scan_timestamp_utc"],
+                        "scan_target": entry["scan_target"],
+                        **summary,
+                    }
+                )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"address": address, "history": history}
+
+
+@app.get("/ports/{port}/hosts", summary="Find Hosts by Port", tags=["Hosts"])
+def get_hosts_with_port(
+    port: int,
+    protocol: str = "tcp",
+    state: str = "open",
+    filename: Optional[str] = None,
+):
+    """
+    Returns the hosts that have `port` in the given state (default: open TCP).
+    By default this is the current state: each host as seen in the newest
+    successful scan that covered it. Pass `filename` to query a single scan.
+    """
+    hosts = []
+    if os.path.isdir(RESULTS_DIR):
+        try:
+            catalog.ensure_catalog(RESULTS_DIR)
+            hosts = catalog.hosts_with_port(
+                RESULTS_DIR, protocol, port, state, filename
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    return {"protocol": protocol, "port": port, "state": state, "hosts": hosts}
+
+
+@app.get("/diff", summary="Compare Two Scans", tags=["Results"])
+def get_diff(
+    from_filename: Optional[str] = Query(None, alias="from"),
+    to_filename: Optional[str] = Query(None, alias="to"),
+):
+    """
+    Returns the hosts that appeared or disappeared, ports that opened or closed,
+    and service/version changes between two scans.
+
+    Without `to`, compares the latest successful scan; without `from`, compares
+    against the previous successful scan of the same target. Those diffs are
+    precomputed by the scanner and served from a small file; other pairs are
+    computed from the catalog indexes, without parsing either scan.
+    """
+    for filename in (from_filename, to_filename):
+        if filename is not None:
+            check_filename(filename)
+    if not os.path.isdir(RESULTS_DIR):
+        raise HTTPException(status_code=404, detail="No scan results found.")
 
     try:
-        # Use Response to serve the file directly with the correct media type
-        with open(file_path, "r") as f:
-            return Response(content=f.read(), media_type="application/json")
+        catalog.ensure_catalog(RESULTS_DIR)
+        if to_filename is None:
+            to_filename = catalog.latest_scan(RESULTS_DIR, successful=True)
+            if to_filename is None:
+                raise HTTPException(status_code=404, detail="No scan results found.")
+        for filename in (from_filename, to_filename):
+            if filename is not None and not catalog.has_scan(RESULTS_DIR, filename):
+                raise HTTPException(status_code=404, detail=f"{filename} not found.")
+
+        stored_path = diff.diff_path(RESULTS_DIR, to_filename)
+        if os.path.isfile(stored_path):
+            with open(stored_path, "rb") as f:
+                content = f.read()
+            if from_filename is None or json.loads(content)["from"] == from_filename:
+                return Response(content=content, media_type="application/json")
+
+        if from_filename is None:
+            raise HTTPException(
+                status_code=404, detail="No earlier scan to compare with."
+            )
+        return diff.diff_scans(RESULTS_DIR, from_filename, to_filename)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Could not read file: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,166 @@
+import time
+
+from app.parser import NmapXmlParser
+
+# Size of each read from a shard's XML file
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _merge_runstats(merged, other):
+    """Sums host counts and keeps the latest finish time of two `runstats` blocks."""
+    if not merged:
+        return other
+    if not other:
+        return merged
+
+    finished = dict(merged.get("finished") or {})
+    other_finished = other.get("finished") or {}
+    if _int(other_finished.get("@time")) > _int(finished.get("@time")):
+        for key in ("@time", "@timestr"):
+            if key in other_finished:
+                finished[key] = other_finished[key]
+    # Any shard that did not finish cleanly marks the whole scan
+    if other_finished.get("@exit", "success") != "success":
+        finished["@exit"] = other_finished["@exit"]
+        if "@errormsg" in other_finished:
+            finished["@errormsg"] = other_finished["@errormsg"]
+
+    hosts = dict(merged.get("hosts") or {})
+    other_hosts = other.get("hosts") or {}
+    for key in ("@up", "@down", "@total"):
+        hosts[key] = str(_int(hosts.get(key)) + _int(other_hosts.get(key)))
+
+    return {**merged, "finished": finished, "hosts": hosts}
+
+
+def merge_documents(merged, other):
+    """
+    Folds one `nmaprun` document (without its hosts) into another, as produced
+    by NmapXmlParser.document. The result keeps the earliest start time, the
+    latest finish time and summed `runstats`; every other key is taken from
+    whichever document had it first. The command line (`@args`) is dropped
+    when the documents' differ, as no single nmap run produced the result.
+    """
+    if merged is None:
+        return dict(other)
+
+    result = {**other, **merged}
+    if other.get("@args") != merged.get("@args"):
+        result.pop("@args", None)
+    if _int(other.get("@start")) and _int(other.get("@start")) < _int(
+        merged.get("@start")
+    ):
+        for key in ("@start", "@startstr"):
+            if key in other:
+                result[key] = other[key]
+
+    result["runstats"] = _merge_runstats(merged.get("runstats"), other.get("runstats"))
+    return result
+
+
+def finalize_document(document):
+    """Recomputes the elapsed time and summary line of a merged document."""
+    finished = (document.get("runstats") or {}).get("finished")
+    if not finished:
+        return document
+
+    start = _int(document.get("@start"))
+    end = _int(finished.get("@time"))
+    if start and end:
+        finished["@elapsed"] = f"{end - start:.2f}"
+
+    hosts = document["runstats"].get("hosts") or {}
+    if "@summary" in finished:
+        finished["@summary"] = (
+            f"Nmap done at {finished.get('@timestr') or time.ctime(end)}; "
+            f"{hosts.get('@total', 0)} IP addresses ({hosts.get('@up', 0)} hosts up) "
+            f"scanned in {finished.get('@elapsed', '0')} seconds"
+        )
+    return document
+
+
+def merge_discovery(document, discovery):
+    """
+    Adjusts a merged port-scan document for the host discovery pass (`-sn`)
+    that picked its hosts: the scan starts when discovery did, and its host
+    counts cover every address discovery probed. Without any port-scan output
+    (no live hosts), the discovery document itself is the result. Otherwise
+    it has no `@args`: two different nmap commands produced it.
+    """
+    if not document:
+        return finalize_document(dict(discovery))
+
+    result = dict(document)
+    result.pop("@args", None)
+    start = _int(discovery.get("@start"))
+    if start and start < _int(result.get("@start"), start + 1):
+        for key in ("@start", "@startstr"):
+            if key in discovery:
+                result[key] = discovery[key]
+
+    runstats = result.get("runstats") or {}
+    total = _int(((discovery.get("runstats") or {}).get("hosts") or {}).get("@total"))
+    if runstats.get("hosts") is not None and total:
+        up = _int(runstats["hosts"].get("@up"))
+        result["runstats"] = {
+            **runstats,
+            "hosts": {
+                **runstats["hosts"],
+                "@down": str(max(total - up, 0)),
+                "@total": str(total),
+            },
+        }
+    return finalize_document(result)
+
+
+def iter_xml_file_hosts(path, parser):
+    """Parses an nmap XML file in chunks with `parser`, yielding each host as it closes."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def merge_xml_files(paths):
+    """
+    Merges the nmap XML output of several shards into one `nmaprun` dictionary
+    with the same shape as a single scan.
+
+    The files are read twice, one at a time: a first pass folds their headers
+    and runstats together, and the returned document's "host" value is a lazy
+    iterator that re-reads them in order (or the host itself, if there is only
+    one). Only one host is held in memory at a time, however many shards there
+    are, so the paths must stay readable until the hosts have been consumed.
+    """
+    merged = None
+    host_count = 0
+    for path in paths:
+        parser = NmapXmlParser()
+        for _ in iter_xml_file_hosts(path, parser):
+            pass
+        merged = merge_documents(merged, parser.document)
+        host_count += parser.host_count
+
+    if merged is None:
+        return {}
+    if len(paths) > 1:
+        merged = finalize_document(merged)
+
+    if host_count:
+        hosts = (
+            host
+            for path in paths
+            for host in iter_xml_file_hosts(path, NmapXmlParser())
+        )
+        merged["host"] = next(hosts) if host_count == 1 else hosts
+    return merged
@@ -0,0 +1,110 @@
+from xml.parsers import expat
+
+
+class NmapXmlParser:
+    """
+    Incremental parser for nmap's XML output ('-oX -').
+
+    Feed it raw bytes as they arrive; every `<host>` element is returned as soon
+    as it closes, in the same dictionary shape xmltodict would produce, and is
+    not kept by the parser. Everything else under `<nmaprun>` (attributes,
+    scaninfo, runstats, ...) is small and is collected in `document`.
+    """
+
+    def __init__(self):
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+        # Stack of [name, item, text chunks] for the currently open elements
+        self._stack = []
+        self._completed = []
+        self.document = {}
+        self.host_count = 0
+
+    def feed(self, data):
+        """Parses a chunk of XML and returns the hosts completed by it."""
+        self._parser.Parse(data, False)
+        return self._take_completed()
+
+    def close(self):
+        """Finishes parsing and returns any hosts completed by the final chunk."""
+        self._parser.Parse(b"", True)
+        return self._take_completed()
+
+    def assemble(self, hosts):
+        """
+        Returns the full `nmaprun` dictionary with `hosts` put back in place:
+        a single dict for one host or a list for several, as xmltodict does.
+        """
+        document = dict(self.document)
+        if "host" in document:
+            document["host"] = hosts
+            if isinstance(hosts, list) and len(hosts) == 1:
+                document["host"] = hosts[0]
+        return document
+
+    def _take_completed(self):
+        completed, self._completed = self._completed, []
+        return completed
+
+    def _start(self, name, attrs):
+        item = {"@" + key: value for key, value in attrs.items()}
+        if not self._stack:
+            # The root <nmaprun> element is the document itself
+            self.document = item
+        self._stack.append([name, item, []])
+
+    def _data(self, data):
+        if self._stack:
+            self._stack[-1][2].append(data)
+
+    def _end(self, name):
+        _, item, text = self._stack.pop()
+        if not self._stack:
+            return
+
+        text = "".join(text).strip()
+        if text:
+            if item:
+                item["#text"] = text
+            else:
+                item = text
+        elif not item:
+            item = None
+
+        if len(self._stack) == 1 and name == "host":
+            self.host_count += 1
+            self._completed.append(item)
+            # Reserve the key so it keeps its position in the document
+            self.document.setdefault("host", None)
+            return
+
+        parent = self._stack[-1][1]
+        if name in parent:
+            if isinstance(parent[name], list):
+                parent[name].append(item)
+            else:
+                parent[name] = [parent[name], item]
+        else:
+            parent[name] = item
+
+
+async def iter_nmap_hosts(parser, chunks):
+    """Feeds an async iterable of XML byte chunks to `parser`, yielding each host as it closes."""
+    async for chunk in chunks:
+        for host in parser.feed(chunk):
+            yield host
+    for host in parser.close():
+        yield host
+
+
+async def parse_nmap_stream(chunks):
+    """
+    Parses nmap XML from an async iterable of byte chunks into the same
+    structure as `xmltodict.parse`, without buffering the raw output.
+    """
+    parser = NmapXmlParser()
+    hosts = [host async for host in iter_nmap_hosts(parser, chunks)]
+    return {"nmaprun": parser.assemble(hosts)}
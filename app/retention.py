@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from app import catalog, diff, storage
+
+# --- Configuration ---
+# Keep every successful scan for this many days. After that, keep one scan per
+# target per day for RETENTION_DAILY_WEEKS weeks, and one per week beyond that.
+# 0 (the default) turns downsampling off and keeps every scan.
+RETENTION_KEEP_ALL_DAYS = int(os.environ.get("RETENTION_KEEP_ALL_DAYS", 0))
+RETENTION_DAILY_WEEKS = int(os.environ.get("RETENTION_DAILY_WEEKS", 12))
+# Error files are deleted after this many days. 0 (the default) keeps them.
+RETENTION_ERROR_DAYS = int(os.environ.get("RETENTION_ERROR_DAYS", 0))
+
+RESULTS_DIR = "/code/app/scan_results"
+
+
+def scan_time(entry):
+    """Returns when a scan ran, from its timestamp or else its filename, or None."""
+    timestamp = entry["scan_timestamp_utc"]
+    if timestamp:
+        try:
+            when = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+            return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    try:
+        # scan_2025-10-03_21-35-31[_error].json
+        when = datetime.strptime(entry["filename"][5:24], "%Y-%m-%d_%H-%M-%S")
+        return when.replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def select_expired(
+    entries,
+    now,
+    keep_all_days=RETENTION_KEEP_ALL_DAYS,
+    daily_weeks=RETENTION_DAILY_WEEKS,
+    error_days=RETENTION_ERROR_DAYS,
+):
+    """
+    Returns the filenames of the catalog `entries` the retention policy drops.
+    Successful scans are bucketed per target by UTC day, then by ISO week, and
+    the newest scan in each bucket is kept. Scans of unknown age are kept.
+    """
+    expired = []
+    buckets = set()
+    # Newest first, so each bucket keeps its newest scan
+    for entry in sorted(entries, key=lambda e: e["filename"], reverse=True):
+        when = scan_time(entry)
+        if when is None:
+            continue
+        age = now - when
+
+        if not entry["scan_successful"]:
+            if error_days and age > timedelta(days=error_days):
+                expired.append(entry["filename"])
+            continue
+
+        if not keep_all_days or age <= timedelta(days=keep_all_days):
+            continue
+        if age <= timedelta(days=keep_all_days, weeks=daily_weeks):
+            bucket = (entry["scan_target"], "day", when.date())
+        else:
+            bucket = (entry["scan_target"], "week", when.isocalendar()[:2])
+        if bucket in buckets:
+            expired.append(entry["filename"])
+        else:
+            buckets.add(bucket)
+    return expired
+
+
+def apply_retention(
+    results_dir,
+    now=None,
+    dry_run=False,
+    keep_all_days=RETENTION_KEEP_ALL_DAYS,
+    daily_weeks=RETENTION_DAILY_WEEKS,
+    error_days=RETENTION_ERROR_DAYS,
+):
+    """
+    Deletes the scans the retention policy drops, with their deltas, diffs and
+    catalog rows. The scans the latest pointers refer to are always kept.
+    Returns the filenames deleted (or, with `dry_run`, that would be).
+    """
+    catalog.sync_catalog(results_dir)
+    entries = catalog.scan_entries(results_dir)
+    pinned = {
+        catalog.resolve_latest(results_dir, successful) for successful in (False, True)
+    }
+    expired = [
+        filename
+        for filename in select_expired(
+            entries,
+            now or datetime.now(timezone.utc),
+            keep_all_days,
+            daily_weeks,
+            error_days,
+        )
+        if filename not in pinned
+    ]
+    if dry_run or not expired:
+        return expired
+
+    gone = set(expired)
+    by_name = {entry["filename"]: entry for entry in entries}
+
+    # A kept delta scan whose chain runs through a deleted scan is rewritten as
+    # a full keyframe first, while its chain can still be replayed. Oldest
+    # first, so later scans see the keyframes written before them.
+    for entry in entries:
+        if entry["filename"] in gone:
+            continue
+        link = entry
+        while link["storage"] == "delta":
+            link = by_name[link["base"]]
+            if link["filename"] in gone:
+                storage.write_keyframe(results_dir, entry["filename"])
+                entry["storage"] = "full"
+                print(f"Rewrote {entry['filename']} as a keyframe.")
+                break
+
+    # Drop the catalog rows first, so the API stops listing the scans before
+    # their files disappear
+    catalog.remove_scans(results_dir, expired)
+    for filename in expired:
+        entry = by_name[filename]
+        for path in (
+            catalog.stored_path(results_dir, filename, entry["storage"]),
+            diff.diff_path(results_dir, filename),
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # Stored diffs against a deleted scan now compare with the wrong one
+    for entry in entries:
+        path = diff.diff_path(results_dir, entry["filename"])
+        if entry["filename"] in gone or not os.path.isfile(path):
+            continue
+        with open(path, "r") as f:
+            if json.load(f)["from"] not in gone:
+                continue
+        if (
+            diff.store_diff(results_dir, entry["filename"], entry["scan_target"])
+            is None
+        ):
+            os.remove(path)
+
+    print(f"Retention removed {len(expired)} scans.")
+    return expired
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Deletes old scan results according to the retention policy."
+    )
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--keep-all-days", type=int, default=RETENTION_KEEP_ALL_DAYS)
+    parser.add_argument("--daily-weeks", type=int, default=RETENTION_DAILY_WEEKS)
+    parser.add_argument("--error-days", type=int, default=RETENTION_ERROR_DAYS)
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="list the scans that would be deleted without deleting them",
+    )
+    args = parser.parse_args()
+
+    expired = apply_retention(
+        args.results_dir,
+        dry_run=args.dry_run,
+        keep_all_days=args.keep_all_days,
+        daily_weeks=args.daily_weeks,
+        error_days=args.error_days,
+    )
+    if args.dry_run:
+        for filename in expired:
+            print(filename)
+        print(f"{len(expired)} scans would be removed.")
+
+
+if __name__ == "__main__":
+    main()
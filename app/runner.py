@@ -0,0 +1,100 @@
+import asyncio
+import os
+import signal
+import subprocess
+
+from app import scheduler
+
+# --- Configuration ---
+# Default wall-clock limit for a single nmap run, in seconds
+NMAP_TIMEOUT = int(os.environ.get("NMAP_TIMEOUT", 300))
+# Size of each read from nmap's stdout
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def nmap_command(target, args=()):
+    """
+    Builds the nmap command line, always requesting XML output on stdout ('-oX -').
+    `target` may be a single target string or a list of them.
+    """
+    targets = [target] if isinstance(target, str) else list(target)
+    return ["nmap", "-oX", "-"] + list(args) + targets
+
+
+def _kill_process_group(proc):
+    """Kills nmap and anything it spawned. Safe to call on an exited process."""
+    if proc.returncode is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def _drain(stream, chunks):
+    """Reads a pipe to EOF, collecting chunks so nmap never blocks on a full pipe."""
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return
+        chunks.append(chunk)
+
+
+async def stream_nmap(target, args=(), timeout=NMAP_TIMEOUT, priority="interactive"):
+    """
+    Runs nmap as an asyncio subprocess and yields its XML stdout in byte chunks
+    as they arrive. stderr is read concurrently in the background.
+
+    Raises subprocess.TimeoutExpired if the run exceeds `timeout` seconds and
+    subprocess.CalledProcessError if nmap exits with a non-zero code, mirroring
+    subprocess.run(). The whole process group is killed on timeout, error, or if
+    the consumer stops iterating early.
+
+    nmap only starts once the shared scheduler grants a worker slot for
+    `priority`; the timeout counts from then.
+    """
+    async with scheduler.slot(priority):
+        cmd = nmap_command(target, args)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # Own process group, so a kill also reaches any helpers nmap started
+            start_new_session=True,
+        )
+        stderr_chunks = []
+        # Keep the tail of stdout so a failed run can still report what nmap printed
+        stdout_tail = b""
+        stderr_task = asyncio.create_task(_drain(proc.stderr, stderr_chunks))
+
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                chunk = await asyncio.wait_for(
+                    proc.stdout.read(READ_CHUNK_SIZE), remaining
+                )
+                if not chunk:
+                    break
+                stdout_tail = (stdout_tail + chunk)[-READ_CHUNK_SIZE:]
+                yield chunk
+
+            await asyncio.wait_for(proc.wait(), max(deadline - loop.time(), 0))
+            await stderr_task
+        except asyncio.TimeoutError:
+            _kill_process_group(proc)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        finally:
+            _kill_process_group(proc)
+            if not stderr_task.done():
+                stderr_task.cancel()
+            await proc.wait()
+
+        if proc.returncode != 0:
+            stderr = b"".join(stderr_chunks).decode(errors="replace")
+            stdout = stdout_tail.decode(errors="replace")
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
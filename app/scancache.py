@@ -0,0 +1,38 @@
+import os
+import time
+from collections import OrderedDict
+
+# --- Configuration ---
+# Number of on-demand scan results kept for reuse with `POST /scan?max_age=...`
+SCAN_CACHE_SIZE = int(os.environ.get("SCAN_CACHE_SIZE", 100))
+
+
+class ScanResultCache:
+    """
+    Remembers the most recent result of each on-demand scan, keyed by the
+    normalized (target, arguments) pair, and evicts the least recently used
+    results beyond `max_entries`. Callers choose how old a result they accept.
+    """
+
+    def __init__(self, max_entries=SCAN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (finished_at, result)
+
+    def get(self, key, max_age):
+        """Returns (result, age in seconds) if a result at most `max_age` old is cached, else None."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        age = time.time() - entry[0]
+        if age > max_age:
+            return None
+        self.entries.move_to_end(key)
+        return entry[1], age
+
+    def put(self, key, result):
+        self.entries.pop(key, None)
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = (time.time(), result)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
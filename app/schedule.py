@@ -0,0 +1,160 @@
+import json
+import math
+import os
+import random
+from datetime import datetime, timedelta
+
+# --- Configuration ---
+# Scans start up to this many seconds after their scheduled time, at random, so
+# targets sharing a schedule do not all launch at once. Targets can override it.
+SCAN_JITTER_SECONDS = int(os.environ.get("SCAN_JITTER_SECONDS", 60))
+
+# Allowed values of each cron field: minute, hour, day of month, month, day of week
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+
+
+class CronExpression:
+    """
+    A standard five-field cron expression ("minute hour day month weekday")
+    with `*`, lists, ranges and steps, evaluated in local time. As in cron, a
+    day matches if either the day of month or the weekday matches when both
+    are restricted. Like Vixie cron, a day field starting with `*` (such as
+    `*/2`) counts as unrestricted, so "0 0 */2 * 1" means odd days that are
+    also Mondays.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = CRON_ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression!r}")
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(field, low, high)
+            for field, (low, high) in zip(fields, CRON_FIELDS)
+        ]
+        # Sunday may be written as 0 or 7; datetime.weekday() counts from Monday
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.any_day = fields[2].startswith("*")
+        self.any_weekday = fields[4].startswith("*")
+
+    def _parse(self, field, low, high):
+        values = set()
+        for part in field.split(","):
+            value_range, _, step = part.partition("/")
+            if value_range == "*":
+                start, end = low, high
+            elif "-" in value_range:
+                start, end = (int(v) for v in value_range.split("-", 1))
+            else:
+                start = end = int(value_range)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(f"Cron field out of range: {field!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, when):
+        day = when.day in self.days
+        weekday = when.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, when):
+        """Returns the first matching minute strictly after `when` (a naive local datetime)."""
+        when = when.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Any valid expression matches within a few years (e.g. Feb 29)
+        limit = when + timedelta(days=366 * 8)
+        while when < limit:
+            if when.month not in self.months:
+                when = (when.replace(day=1) + timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(when):
+                when = when.replace(hour=0, minute=0) + timedelta(days=1)
+            elif when.hour not in self.hours:
+                when = when.replace(minute=0) + timedelta(hours=1)
+            elif when.minute not in self.minutes:
+                when += timedelta(minutes=1)
+            else:
+                return when
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+class ScanSchedule:
+    """
+    When one target is scanned: every `interval_hours` or per a `cron`
+    expression. Interval runs are anchored to the Unix epoch rather than to
+    the end of the previous scan, so the schedule does not drift.
+    """
+
+    def __init__(
+        self, target, interval_hours=None, cron=None, jitter_seconds=SCAN_JITTER_SECONDS
+    ):
+        if not target:
+            raise ValueError("Scan target cannot be empty.")
+        if (interval_hours is None) == (cron is None):
+            raise ValueError(f"{target}: give exactly one of interval_hours and cron.")
+        if interval_hours is not None and interval_hours <= 0:
+            raise ValueError(f"{target}: interval_hours must be positive.")
+        self.target = target
+        self.interval = interval_hours * 60 * 60 if interval_hours is not None else None
+        self.cron = CronExpression(cron) if cron is not None else None
+        self.jitter_seconds = jitter_seconds
+
+    def describe(self):
+        if self.cron is not None:
+            return f"cron {self.cron.expression!r}"
+        return f"every {self.interval / 3600:g} hours"
+
+    def next_run(self, after):
+        """Returns the first scheduled time (a Unix timestamp) strictly after `after`."""
+        if self.cron is not None:
+            return self.cron.next_after(datetime.fromtimestamp(after)).timestamp()
+        return (math.floor(after / self.interval) + 1) * self.interval
+
+    def first_run(self, now, last_scan):
+        """
+        Returns when to scan first: right away if an interval target's last
+        scan (a Unix timestamp, or None) is a full interval old, otherwise at
+        the next scheduled time.
+        """
+        if self.interval is not None and (
+            last_scan is None or now - last_scan >= self.interval
+        ):
+            return now
+        return self.next_run(now)
+
+    def jitter(self):
+        return random.uniform(0, self.jitter_seconds) if self.jitter_seconds > 0 else 0
+
+
+def load_schedules(path):
+    """
+    Reads the scan targets from a JSON file holding a list of objects like
+    {"target": "192.168.1.0/24", "interval_hours": 12} or
+    {"target": "10.0.0.5", "cron": "30 */6 * * *", "jitter_seconds": 0}.
+    """
+    with open(path, "r") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"{path} must contain a list of scan targets.")
+    schedules = []
+    for entry in entries:
+        options = {
+            key: entry[key]
+            for key in ("interval_hours", "cron", "jitter_seconds")
+            if key in entry
+        }
+        schedules.append(ScanSchedule(entry.get("target"), **options))
+    return schedules
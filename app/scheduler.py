@@ -0,0 +1,161 @@
+import asyncio
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+# --- Configuration ---
+# Number of nmap processes allowed at once across the API and the scanner.
+# 0 turns the shared scheduler off.
+NMAP_WORKER_SLOTS = int(os.environ.get("NMAP_WORKER_SLOTS", 4))
+# Directory shared by every process taking part, e.g. the scan results volume
+SCHEDULER_DIR = os.environ.get("SCHEDULER_DIR", "/code/app/scan_results")
+# A waiting scan moves up one priority class for every this many seconds it
+# has waited, so periodic and backfill work still runs under constant load
+SCHEDULER_AGING_SECONDS = int(os.environ.get("SCHEDULER_AGING_SECONDS", 300))
+
+SCHEDULER_FILENAME = "scheduler.sqlite3"
+# Leases not renewed for this long are dropped, e.g. if their process crashed
+LEASE_SECONDS = 60
+# How often a waiting scan checks whether it may start
+POLL_SECONDS = 0.5
+
+# Priority classes, most urgent first
+PRIORITIES = {"interactive": 0, "periodic": 1, "backfill": 2}
+
+
+def _connect():
+    os.makedirs(SCHEDULER_DIR, exist_ok=True)
+    conn = sqlite3.connect(
+        os.path.join(SCHEDULER_DIR, SCHEDULER_FILENAME),
+        timeout=30,
+        # Transactions are managed explicitly with BEGIN IMMEDIATE
+        isolation_level=None,
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS leases ("
+        " id TEXT PRIMARY KEY,"
+        " priority INTEGER NOT NULL,"
+        " submitted REAL NOT NULL,"
+        " renewed REAL NOT NULL,"
+        " running INTEGER NOT NULL DEFAULT 0)"
+    )
+    return conn
+
+
+def _enqueue(lease, priority):
+    conn = _connect()
+    try:
+        now = time.time()
+        conn.execute(
+            "INSERT INTO leases (id, priority, submitted, renewed) VALUES (?, ?, ?, ?)",
+            (lease, priority, now, now),
+        )
+    finally:
+        conn.close()
+
+
+def _try_start(lease):
+    """
+    Starts the waiting lease if a slot is free and it is among the most urgent
+    waiting leases that fit into the free slots. Returns True once it runs.
+    """
+    conn = _connect()
+    try:
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE renewed < ?", (now - LEASE_SECONDS,))
+            conn.execute("UPDATE leases SET renewed = ? WHERE id = ?", (now, lease))
+            running = conn.execute(
+                "SELECT COUNT(*) FROM leases WHERE running"
+            ).fetchone()[0]
+            free = NMAP_WORKER_SLOTS - running
+            started = False
+            if free > 0:
+                chosen = conn.execute(
+                    "SELECT id FROM leases WHERE NOT running"
+                    " ORDER BY priority - (? - submitted) / ?, submitted LIMIT ?",
+                    (now, max(SCHEDULER_AGING_SECONDS, 1), free),
+                )
+                if lease in {row[0] for row in chosen}:
+                    conn.execute("UPDATE leases SET running = 1 WHERE id = ?", (lease,))
+                    started = True
+            conn.execute("COMMIT")
+            return started
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+def _renew(lease):
+    conn = _connect()
+    try:
+        conn.execute("UPDATE leases SET renewed = ? WHERE id = ?", (time.time(), lease))
+    finally:
+        conn.close()
+
+
+def _remove(lease):
+    conn = _connect()
+    try:
+        conn.execute("DELETE FROM leases WHERE id = ?", (lease,))
+    finally:
+        conn.close()
+
+
+async def _keep_alive(lease):
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        await asyncio.to_thread(_renew, lease)
+
+
+@asynccontextmanager
+async def slot(priority="interactive"):
+    """
+    Holds one of the NMAP_WORKER_SLOTS shared worker slots for the duration
+    of the block, waiting for one if needed. Waiting scans start in priority
+    order ("interactive", "periodic", "backfill"), adjusted for how long they
+    have waited, then in order of arrival.
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown scan priority: {priority}")
+    if NMAP_WORKER_SLOTS <= 0:
+        yield
+        return
+
+    lease = uuid.uuid4().hex
+    await asyncio.to_thread(_enqueue, lease, PRIORITIES[priority])
+    try:
+        while not await asyncio.to_thread(_try_start, lease):
+            await asyncio.sleep(POLL_SECONDS)
+        renewer = asyncio.create_task(_keep_alive(lease))
+        try:
+            yield
+        finally:
+            renewer.cancel()
+    finally:
+        await asyncio.to_thread(_remove, lease)
+
+
+def status():
+    """Returns the number of slots and the running and waiting scans per priority class."""
+    result = {"slots": NMAP_WORKER_SLOTS, "running": {}, "waiting": {}}
+    if NMAP_WORKER_SLOTS <= 0:
+        return result
+    names = {rank: name for name, rank in PRIORITIES.items()}
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT priority, running, COUNT(*) FROM leases WHERE renewed >= ?"
+            " GROUP BY priority, running",
+            (time.time() - LEASE_SECONDS,),
+        )
+        for priority, running, count in rows:
+            result["running" if running else "waiting"][names[priority]] = count
+    finally:
+        conn.close()
+    return result
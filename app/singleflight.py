@@ -0,0 +1,54 @@
+import asyncio
+import ipaddress
+
+
+def scan_key(target, args):
+    """
+    Normalizes a scan request so equivalent requests compare equal: networks
+    and addresses in canonical form, hostnames lowercased, arguments split on
+    whitespace. Argument order is kept, since it can matter to nmap.
+    """
+    target = target.strip()
+    try:
+        target = str(ipaddress.ip_network(target, strict=False))
+    except ValueError:
+        target = target.lower()
+    return (target, tuple(args))
+
+
+class _Call:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time; callers arriving while it runs
+    wait for it and share its result (or exception). The call is cancelled
+    only when every caller waiting for it has been cancelled.
+    All methods must be called from the event loop thread.
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, run):
+        """Returns the result of `run()` (a coroutine function), shared by key."""
+        call = self.calls.get(key)
+        if call is None:
+            call = self.calls[key] = _Call(asyncio.ensure_future(run()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        call.waiters += 1
+        try:
+            # Shielded, so one caller disconnecting does not cancel the others' scan
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._forget(key, call)
+
+    def _forget(self, key, call):
+        if self.calls.get(key) is call:
+            del self.calls[key]
@@ -0,0 +1,350 @@
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+from app import catalog, jsonstream
+from app.hosts import as_list, host_addresses
+
+# --- Configuration ---
+# "full" writes every scan as a complete JSON file; "delta" stores a complete
+# keyframe every KEYFRAME_INTERVAL scans and structural deltas in between
+STORAGE_MODE = os.environ.get("STORAGE_MODE", "full")
+KEYFRAME_INTERVAL = int(os.environ.get("KEYFRAME_INTERVAL", 10))
+# Number of reconstructed scan documents kept in memory, so rebuilding a delta
+# scan rarely has to replay its chain from the keyframe on disk
+DOCUMENT_CACHE_SIZE = int(os.environ.get("DOCUMENT_CACHE_SIZE", 8))
+# Number of parsed delta files kept in memory, for reading single host records
+DELTA_CACHE_SIZE = int(os.environ.get("DELTA_CACHE_SIZE", 64))
+
+# List elements are aligned by these keys when present (hosts by address,
+# ports by protocol and number), so one new host does not shift all the others
+IDENTITY_KEYS = ("address", "@protocol", "@portid", "@name")
+
+
+# --- Structural deltas ---
+def compute_delta(base, new):
+    """
+    Returns a delta that turns `base` into `new`, or None if they are equal.
+
+    A delta is one of:
+      {"=": value}                      replace with value
+      {"d": {key: delta}, "x": [keys],  patch an object: changed/added members,
+       "k": [keys]}                     removed members, and key order if it moved
+      {"l": [op, ...]}                  rebuild a list from ops: ["c", i, n] copies
+                                        n base elements from index i, ["p", i, delta]
+                                        patches base[i], ["n", value] inserts value
+    """
+    if base == new and _same(base, new):
+        return None
+
+    if isinstance(base, dict) and isinstance(new, dict):
+        delta = {}
+        changes = {}
+        for key, value in new.items():
+            if key in base:
+                change = compute_delta(base[key], value)
+                if change is not None:
+                    changes[key] = change
+            else:
+                changes[key] = {"=": value}
+        if changes:
+            delta["d"] = changes
+        removed = [key for key in base if key not in new]
+        if removed:
+            delta["x"] = removed
+        default_order = [key for key in base if key in new]
+        default_order += [key for key in new if key not in base]
+        if list(new) != default_order:
+            delta["k"] = list(new)
+        return delta
+
+    if isinstance(base, list) and isinstance(new, list):
+        return {"l": _list_delta(base, new)}
+
+    return {"=": new}
+
+
+def _same(a, b):
+    """Like a == b, but objects must also list their keys in the same order (== ignores it)."""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return list(a) == list(b) and all(_same(a[key], b[key]) for key in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def _identity(value):
+    if isinstance(value, dict):
+        key = {name: value[name] for name in IDENTITY_KEYS if name in value}
+        if key:
+            return json.dumps(key, sort_keys=True)
+    return json.dumps(value, sort_keys=True)
+
+
+def _list_delta(base, new):
+    ops = []
+
+    def copy(index):
+        # Extend the previous copy op when the run continues
+        if ops and ops[-1][0] == "c" and ops[-1][1] + ops[-1][2] == index:
+            ops[-1][2] += 1
+        else:
+            ops.append(["c", index, 1])
+
+    matcher = SequenceMatcher(
+        None, [_identity(v) for v in base], [_identity(v) for v in new], autojunk=False
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(i2 - i1):
+                change = compute_delta(base[i1 + offset], new[j1 + offset])
+                if change is None:
+                    copy(i1 + offset)
+                else:
+                    ops.append(["p", i1 + offset, change])
+        elif tag in ("replace", "insert"):
+            ops.extend(["n", value] for value in new[j1:j2])
+    return ops
+
+
+def apply_delta(base, delta):
+    """Rebuilds a value from `base` and a delta made by compute_delta. `base` is not modified."""
+    if "=" in delta:
+        return delta["="]
+
+    if "l" in delta:
+        result = []
+        for op in delta["l"]:
+            if op[0] == "c":
+                result.extend(base[op[1] : op[1] + op[2]])
+            elif op[0] == "p":
+                result.append(apply_delta(base[op[1]], op[2]))
+            else:
+                result.append(op[1])
+        return result
+
+    changes = delta.get("d", {})
+    removed = set(delta.get("x", ()))
+    result = {}
+    for key, value in base.items():
+        if key not in removed:
+            result[key] = apply_delta(value, changes[key]) if key in changes else value
+    for key, change in changes.items():
+        if key not in base:
+            result[key] = change["="]
+    if "k" in delta:
+        result = {key: result[key] for key in delta["k"]}
+    return result
+
+
+# --- Reading scans ---
+_documents = OrderedDict()
+_documents_lock = threading.Lock()
+
+
+def load_document(results_dir, filename, cache=True):
+    """
+    Returns the parsed scan document for a catalogued scan, rebuilding delta
+    scans from their keyframe. Results are cached and must not be modified;
+    with `cache=False` the document itself is not added to the cache.
+    """
+    key = (results_dir, filename)
+    with _documents_lock:
+        if key in _documents:
+            _documents.move_to_end(key)
+            return _documents[key]
+
+    entry = catalog.scan_entry(results_dir, filename)
+    storage = entry["storage"] if entry else "full"
+    with open(catalog.stored_path(results_dir, filename, storage), "r") as f:
+        stored = json.load(f)
+    if storage == "delta":
+        document = apply_delta(
+            load_document(results_dir, stored["base"]), stored["delta"]
+        )
+    else:
+        document = stored
+
+    if not cache:
+        return document
+    with _documents_lock:
+        _documents[key] = document
+        while len(_documents) > DOCUMENT_CACHE_SIZE:
+            _documents.popitem(last=False)
+    return document
+
+
+def load_bytes(results_dir, filename):
+    """Returns the full JSON text of a scan exactly as a full file would hold it."""
+    entry = catalog.scan_entry(results_dir, filename)
+    if entry is None or entry["storage"] != "delta":
+        with open(os.path.join(results_dir, filename), "rb") as f:
+            return f.read()
+    buffer = io.StringIO()
+    jsonstream.dump(load_document(results_dir, filename), buffer, indent=4)
+    return buffer.getvalue().encode()
+
+
+def read_host_record(results_dir, filename, position, length, address=None):
+    """
+    Reads a single host record of a scan, without parsing the rest of a full file.
+    Delta-stored scans have no file to seek in: given the host's `address`,
+    only the changes to that host are replayed onto its record in the
+    keyframe, instead of rebuilding the whole scan.
+    """
+    entry = catalog.scan_entry(results_dir, filename)
+    if entry is not None and entry["storage"] == "delta":
+        if address is not None:
+            host = _delta_host(results_dir, filename, address)
+            if host is not None:
+                return host
+        content = load_bytes(results_dir, filename)
+        return json.loads(content[position : position + length])
+    with open(os.path.join(results_dir, filename), "rb") as f:
+        f.seek(position)
+        return json.loads(f.read(length))
+
+
+_deltas = OrderedDict()
+_deltas_lock = threading.Lock()
+
+
+def _load_delta(results_dir, filename):
+    """Returns the parsed delta file of a delta-stored scan. Delta files are small; many are cached."""
+    key = (results_dir, filename)
+    with _deltas_lock:
+        if key in _deltas:
+            _deltas.move_to_end(key)
+            return _deltas[key]
+    with open(catalog.stored_path(results_dir, filename, "delta"), "r") as f:
+        stored = json.load(f)
+    with _deltas_lock:
+        _deltas[key] = stored
+        while len(_deltas) > DELTA_CACHE_SIZE:
+            _deltas.popitem(last=False)
+    return stored
+
+
+def _find_host(hosts, address):
+    for host in as_list(hosts):
+        if isinstance(host, dict) and address in host_addresses(host):
+            return host
+    return None
+
+
+def _host_in(results_dir, filename, address):
+    """Returns `address`'s host record in any catalogued scan, or None."""
+    entry = catalog.scan_entry(results_dir, filename)
+    if entry is not None and entry["storage"] == "delta":
+        return _delta_host(results_dir, filename, address)
+    location = catalog.host_location(results_dir, filename, address)
+    if location is None:
+        return None
+    return read_host_record(
+        results_dir, filename, location["position"], location["length"]
+    )
+
+
+def _delta_host(results_dir, filename, address):
+    """
+    Returns `address`'s host record in a delta-stored scan by following the
+    delta down to the host list, or None if it cannot be found that way.
+    """
+    stored = _load_delta(results_dir, filename)
+    base = stored["base"]
+    delta = stored["delta"]
+    for key in ("nmap_data", "host"):
+        if "=" in delta:
+            value = delta["="]
+            if key == "nmap_data":
+                value = (value or {}).get("host") if isinstance(value, dict) else None
+            return _find_host(value, address)
+        if "l" in delta or key in delta.get("x", ()):
+            return None
+        if key not in delta.get("d", {}):
+            # Unchanged since the base scan
+            return _host_in(results_dir, base, address)
+        delta = delta["d"][key]
+
+    if "=" in delta:
+        return _find_host(delta["="], address)
+    if "l" not in delta:
+        # A single host, patched
+        host = _host_in(results_dir, base, address)
+        return apply_delta(host, delta) if host is not None else None
+
+    # List elements are aligned by address, so a copied or patched element
+    # is the same host at its index in the base scan
+    location = catalog.host_location(results_dir, base, address)
+    index = location["host_index"] if location else None
+    for op in delta["l"]:
+        if op[0] == "n":
+            if _find_host(op[1], address) is not None:
+                return op[1]
+        elif op[0] == "c":
+            if index is not None and op[1] <= index < op[1] + op[2]:
+                return _host_in(results_dir, base, address)
+        elif op[1] == index:
+            host = _host_in(results_dir, base, address)
+            return apply_delta(host, op[2]) if host is not None else None
+    return None
+
+
+# --- Writing scans ---
+def delta_base(results_dir, filename, scan):
+    """
+    Decides how a new scan should be stored. Returns (base filename, chain
+    length) if it should be a delta, or (None, 0) if a keyframe is due.
+    """
+    if STORAGE_MODE != "delta" or not scan.get("scan_successful"):
+        return None, 0
+    base = catalog.previous_scan(results_dir, filename, scan.get("scan_target"))
+    if base is None:
+        return None, 0
+    chain = catalog.scan_entry(results_dir, base)["chain"] + 1
+    if chain >= KEYFRAME_INTERVAL:
+        return None, 0
+    return base, chain
+
+
+def materialize(scan):
+    """Turns a lazy host iterator into a list, so the document can be read twice."""
+    nmap_data = scan.get("nmap_data")
+    if isinstance(nmap_data, dict) and "host" in nmap_data:
+        hosts = nmap_data["host"]
+        if not isinstance(hosts, (dict, list)):
+            scan = {**scan, "nmap_data": {**nmap_data, "host": list(hosts)}}
+    return scan
+
+
+def write_delta(results_dir, filename, base, scan):
+    """Stores `scan` as a delta against the scan `base`. Returns the stored path."""
+    delta = compute_delta(load_document(results_dir, base), scan)
+    path = catalog.stored_path(results_dir, filename, "delta")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"base": base, "delta": delta or {}}, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_keyframe(results_dir, filename):
+    """
+    Rewrites a delta-stored scan as a full file, e.g. before its base is
+    deleted. The content, hash and host offsets stay the same.
+    """
+    path = catalog.stored_path(results_dir, filename)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(load_bytes(results_dir, filename))
+    os.replace(tmp_path, path)
+    catalog.mark_keyframe(results_dir, filename)
+    # The latest pointers may refer to the delta file, which goes away now
+    catalog.move_latest_pointers(results_dir, filename)
+    os.remove(catalog.stored_path(results_dir, filename, "delta"))
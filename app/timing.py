@@ -0,0 +1,81 @@
+import ipaddress
+import math
+import os
+from statistics import median
+
+from app.runner import NMAP_TIMEOUT
+
+# --- Configuration ---
+# Wall-clock time a periodic scan of one target should take, in seconds. The
+# scanner tunes nmap's timing from each target's past scans to get there.
+# 0 (the default) keeps nmap's default timing and NMAP_TIMEOUT.
+SCAN_COMPLETION_SECONDS = int(os.environ.get("SCAN_COMPLETION_SECONDS", 0))
+# Upper bound for the --min-rate (packets per second) the tuning may ask for
+SCAN_MAX_RATE = int(os.environ.get("SCAN_MAX_RATE", 1000))
+
+# Number of past scans of a target the tuning looks at
+TIMING_HISTORY = 5
+# Probes per live host (nmap's default top 1000 TCP ports) and per address
+# (host discovery), used to estimate how many packets a scan sends
+PROBES_PER_HOST = 1000
+PROBES_PER_ADDRESS = 2
+MIN_HOST_TIMEOUT = 60
+# The subprocess timeout never grows beyond this many times the completion time
+MAX_TIMEOUT_FACTOR = 3
+
+
+def address_count(target):
+    """Returns the number of addresses a target covers (1 for a hostname)."""
+    try:
+        return ipaddress.ip_network(target, strict=False).num_addresses
+    except ValueError:
+        return 1
+
+
+def plan_timing(
+    target,
+    history,
+    completion_seconds=SCAN_COMPLETION_SECONDS,
+    processes=1,
+    max_timeout=None,
+):
+    """
+    Picks nmap timing options and a subprocess timeout for a scan of `target`,
+    given its recent (duration, host_count, successful) history, newest first.
+    `processes` is how many nmap runs share the target at once (its shards).
+    `max_timeout`, e.g. the target's schedule interval, bounds the timeout.
+    Returns (extra nmap arguments, timeout in seconds).
+
+    The timeout is twice the longest recent run: a run killed by its timeout
+    doubles the next run's limit, so a target that outgrew NMAP_TIMEOUT is no
+    longer killed every time. It stops growing at MAX_TIMEOUT_FACTOR times the
+    completion time (and `max_timeout`), so a hung target cannot hold its
+    worker slots for ever longer. Targets expected to take more than half the
+    completion time get fewer retries and a per-host time limit, and those
+    expected to overrun it a --min-rate that sends their probes in time.
+    """
+    durations = [duration for duration, _, _ in history]
+    if not completion_seconds or not durations:
+        return [], NMAP_TIMEOUT
+    limit = max(NMAP_TIMEOUT, MAX_TIMEOUT_FACTOR * completion_seconds)
+    if max_timeout:
+        limit = min(limit, max_timeout)
+    timeout = min(max(NMAP_TIMEOUT, math.ceil(2 * max(durations))), limit)
+
+    successful = [(duration, hosts) for duration, hosts, ok in history if ok]
+    if not successful:
+        return [], timeout
+    expected = median(duration for duration, _ in successful)
+    hosts = max(hosts or 0 for _, hosts in successful)
+    ratio = expected / completion_seconds
+
+    args = []
+    if ratio > 0.5:
+        args += ["--max-retries", "1" if ratio > 1 else "3"]
+        host_timeout = max(MIN_HOST_TIMEOUT, completion_seconds // 2)
+        args += ["--host-timeout", f"{host_timeout}s"]
+    if ratio > 1:
+        probes = hosts * PROBES_PER_HOST + address_count(target) * PROBES_PER_ADDRESS
+        rate = math.ceil(probes / completion_seconds / max(1, processes))
+        args += ["--min-rate", str(max(1, min(rate, SCAN_MAX_RATE)))]
+    return args, timeout
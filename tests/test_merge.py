@@ -0,0 +1,43 @@
+from app.merge import merge_discovery, merge_documents
+
+
+def shard(args, start, finish, up, down):
+    return {
+        "@scanner": "nmap",
+        "@args": args,
+        "@start": str(start),
+        "runstats": {
+            "finished": {"@time": str(finish), "@exit": "success"},
+            "hosts": {"@up": str(up), "@down": str(down), "@total": str(up + down)},
+        },
+    }
+
+
+def test_merge_documents():
+    merged = merge_documents(None, shard("nmap -oX - 10.0.0.0/25", 200, 300, 3, 125))
+    merged = merge_documents(
+        merged, shard("nmap -oX - 10.0.0.128/25", 100, 400, 2, 126)
+    )
+    assert merged["@start"] == "100"
+    assert merged["runstats"]["finished"]["@time"] == "400"
+    assert merged["runstats"]["hosts"] == {"@up": "5", "@down": "251", "@total": "256"}
+    # No single command line describes the shards together
+    assert "@args" not in merged
+    merged = merge_documents(merged, shard("nmap -oX - 10.0.1.0/24", 100, 400, 0, 256))
+    assert "@args" not in merged
+
+
+def test_merge_documents_with_the_same_args():
+    document = shard("nmap -oX - 10.0.0.0/24", 100, 200, 1, 255)
+    assert merge_documents(document, dict(document))["@args"] == document["@args"]
+
+
+def test_merge_discovery():
+    discovery = shard("nmap -sn -oX - 10.0.0.0/24", 100, 150, 2, 254)
+    ports = shard("nmap -Pn -oX - 10.0.0.1 10.0.0.5", 160, 300, 2, 0)
+    result = merge_discovery(ports, discovery)
+    assert result["@start"] == "100"
+    assert result["runstats"]["hosts"] == {"@up": "2", "@down": "254", "@total": "256"}
+    assert "@args" not in result
+    # Without live hosts the discovery scan is the whole scan
+    assert merge_discovery({}, discovery)["@args"] == discovery["@args"]
@@ -0,0 +1,203 @@
+import asyncio
+import json
+
+import pytest
+
+from app.parser import parse_nmap_stream
+
+# The expected values below are what xmltodict.parse() returns for the same XML
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE nmaprun>
+<?xml-stylesheet href="file:///usr/share/nmap/nmap.xsl" type="text/xsl"?>
+<nmaprun scanner="nmap" args="nmap -sV -oX - 10.0.0.0/30" start="1700000000" version="7.94" xmloutputversion="1.05">
+<scaninfo type="syn" protocol="tcp" numservices="2" services="22,80"/>
+<verbose level="0"/>
+<debugging level="0"/>
+"""
+
+FOOTER = """<runstats><finished time="1700000010" elapsed="10.00" exit="success"/><hosts up="{up}" down="{down}" total="4"/>
+</runstats>
+</nmaprun>
+"""
+
+ONE_HOST = (
+    HEADER + """<hosthint><status state="up" reason="arp-response" reason_ttl="0"/>
+<address addr="10.0.0.1" addrtype="ipv4"/>
+<hostnames>
+</hostnames>
+</hosthint>
+<host starttime="1700000001" endtime="1700000009"><status state="up" reason="arp-response" reason_ttl="0"/>
+<address addr="10.0.0.1" addrtype="ipv4"/>
+<address addr="00:11:22:33:44:55" addrtype="mac" vendor="Acme"/>
+<hostnames>
+<hostname name="gw.local" type="PTR"/>
+</hostnames>
+<ports><extraports state="closed" count="1">
+<extrareasons reason="reset" count="1" proto="tcp" ports="80"/>
+</extraports>
+<port protocol="tcp" portid="22"><state state="open" reason="syn-ack" reason_ttl="64"/><service name="ssh" product="OpenSSH" version="9.6" method="probed" conf="10"><cpe>cpe:/a:openbsd:openssh:9.6</cpe></service><script id="ssh-hostkey" output="&#xa;  256 aa:bb (ED25519)"><table>
+<elem key="type">ssh-ed25519</elem>
+<elem key="bits">256</elem>
+</table>
+</script></port>
+</ports>
+<times srtt="512" rttvar="100" to="100000"/>
+</host>
+""" + FOOTER.format(up=1, down=3)
+)
+
+MANY_HOSTS = (
+    HEADER
+    + "".join(
+        f"""<host starttime="1700000001" endtime="1700000009"><status state="up" reason="echo-reply" reason_ttl="64"/>
+<address addr="10.0.0.{i}" addrtype="ipv4"/>
+<hostnames>
+</hostnames>
+<ports><port protocol="tcp" portid="22"><state state="{state}" reason="syn-ack" reason_ttl="64"/><service name="ssh" method="table" conf="3"/></port>
+</ports>
+<times srtt="{i}00" rttvar="50" to="100000"/>
+</host>
+"""
+        for i, state in ((1, "open"), (2, "closed"), (3, "filtered"))
+    )
+    + FOOTER.format(up=3, down=1)
+)
+
+NO_HOSTS = HEADER + FOOTER.format(up=0, down=4)
+
+NMAPRUN = {
+    "@scanner": "nmap",
+    "@args": "nmap -sV -oX - 10.0.0.0/30",
+    "@start": "1700000000",
+    "@version": "7.94",
+    "@xmloutputversion": "1.05",
+    "scaninfo": {
+        "@type": "syn",
+        "@protocol": "tcp",
+        "@numservices": "2",
+        "@services": "22,80",
+    },
+    "verbose": {"@level": "0"},
+    "debugging": {"@level": "0"},
+}
+
+
+def runstats(up, down):
+    return {
+        "finished": {"@time": "1700000010", "@elapsed": "10.00", "@exit": "success"},
+        "hosts": {"@up": str(up), "@down": str(down), "@total": "4"},
+    }
+
+
+def listed_host(i, state):
+    return {
+        "@starttime": "1700000001",
+        "@endtime": "1700000009",
+        "status": {"@state": "up", "@reason": "echo-reply", "@reason_ttl": "64"},
+        "address": {"@addr": f"10.0.0.{i}", "@addrtype": "ipv4"},
+        "hostnames": None,
+        "ports": {
+            "port": {
+                "@protocol": "tcp",
+                "@portid": "22",
+                "state": {"@state": state, "@reason": "syn-ack", "@reason_ttl": "64"},
+                "service": {"@name": "ssh", "@method": "table", "@conf": "3"},
+            }
+        },
+        "times": {"@srtt": f"{i}00", "@rttvar": "50", "@to": "100000"},
+    }
+
+
+def parse(xml, chunk_size):
+    data = xml.encode()
+
+    async def chunks():
+        for start in range(0, len(data), chunk_size):
+            yield data[start : start + chunk_size]
+
+    return asyncio.run(parse_nmap_stream(chunks()))
+
+
+def assert_same(result, expected):
+    # Key order matters too: the stored JSON text must match xmltodict's
+    assert json.dumps(result) == json.dumps(expected)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 10000])
+def test_one_host(chunk_size):
+    host = {
+        "@starttime": "1700000001",
+        "@endtime": "1700000009",
+        "status": {"@state": "up", "@reason": "arp-response", "@reason_ttl": "0"},
+        "address": [
+            {"@addr": "10.0.0.1", "@addrtype": "ipv4"},
+            {"@addr": "00:11:22:33:44:55", "@addrtype": "mac", "@vendor": "Acme"},
+        ],
+        "hostnames": {"hostname": {"@name": "gw.local", "@type": "PTR"}},
+        "ports": {
+            "extraports": {
+                "@state": "closed",
+                "@count": "1",
+                "extrareasons": {
+                    "@reason": "reset",
+                    "@count": "1",
+                    "@proto": "tcp",
+                    "@ports": "80",
+                },
+            },
+            "port": {
+                "@protocol": "tcp",
+                "@portid": "22",
+                "state": {"@state": "open", "@reason": "syn-ack", "@reason_ttl": "64"},
+                "service": {
+                    "@name": "ssh",
+                    "@product": "OpenSSH",
+                    "@version": "9.6",
+                    "@method": "probed",
+                    "@conf": "10",
+                    "cpe": "cpe:/a:openbsd:openssh:9.6",
+                },
+                "script": {
+                    "@id": "ssh-hostkey",
+                    "@output": "\n  256 aa:bb (ED25519)",
+                    "table": {
+                        "elem": [
+                            {"@key": "type", "#text": "ssh-ed25519"},
+                            {"@key": "bits", "#text": "256"},
+                        ]
+                    },
+                },
+            },
+        },
+        "times": {"@srtt": "512", "@rttvar": "100", "@to": "100000"},
+    }
+    hosthint = {
+        "status": {"@state": "up", "@reason": "arp-response", "@reason_ttl": "0"},
+        "address": {"@addr": "10.0.0.1", "@addrtype": "ipv4"},
+        "hostnames": None,
+    }
+    expected = {
+        **NMAPRUN,
+        "hosthint": hosthint,
+        "host": host,
+        "runstats": runstats(1, 3),
+    }
+    assert_same(parse(ONE_HOST, chunk_size), {"nmaprun": expected})
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 10000])
+def test_many_hosts(chunk_size):
+    hosts = [
+        listed_host(1, "open"),
+        listed_host(2, "closed"),
+        listed_host(3, "filtered"),
+    ]
+    expected = {**NMAPRUN, "host": hosts, "runstats": runstats(3, 1)}
+    assert_same(parse(MANY_HOSTS, chunk_size), {"nmaprun": expected})
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 10000])
+def test_no_hosts(chunk_size):
+    expected = {**NMAPRUN, "runstats": runstats(0, 4)}
+    assert_same(parse(NO_HOSTS, chunk_size), {"nmaprun": expected})
@@ -0,0 +1,133 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from app.schedule import CronExpression, ScanSchedule, load_schedules
+
+
+def next_after(expression, when):
+    return CronExpression(expression).next_after(when)
+
+
+def test_next_after_is_strictly_later():
+    assert next_after("30 */6 * * *", datetime(2026, 10, 18, 5, 31)) == datetime(
+        2026, 10, 18, 6, 30
+    )
+    assert next_after("30 */6 * * *", datetime(2026, 10, 18, 6, 30)) == datetime(
+        2026, 10, 18, 12, 30
+    )
+    # Seconds are dropped: 06:29:59 is still before the 06:30 run
+    assert next_after("30 */6 * * *", datetime(2026, 10, 18, 6, 29, 59)) == datetime(
+        2026, 10, 18, 6, 30
+    )
+
+
+def test_lists_ranges_and_steps():
+    cron = CronExpression("5/20,50 8-10 * * *")
+    assert cron.minutes == {5, 25, 45, 50}
+    assert cron.hours == {8, 9, 10}
+    assert next_after("0 9 * * 1-5", datetime(2026, 10, 17, 10)) == datetime(
+        2026, 10, 19, 9
+    )
+
+
+def test_aliases():
+    assert next_after("@daily", datetime(2026, 12, 31, 23, 59)) == datetime(2027, 1, 1)
+    assert next_after("@monthly", datetime(2026, 10, 18)) == datetime(2026, 11, 1)
+
+
+def test_sunday_is_0_or_7():
+    assert CronExpression("0 0 * * 0").weekdays == CronExpression("0 0 * * 7").weekdays
+    # 2026-10-25 is a Sunday
+    assert next_after("0 0 * * 7", datetime(2026, 10, 18, 1)) == datetime(2026, 10, 25)
+
+
+def test_day_of_month_or_weekday():
+    # Both restricted: the 13th or any Friday, whichever comes first
+    assert next_after("0 0 13 * 5", datetime(2026, 10, 18)) == datetime(2026, 10, 23)
+    # Only one restricted: that one decides
+    assert next_after("0 0 13 * *", datetime(2026, 10, 18)) == datetime(2026, 11, 13)
+    assert next_after("0 0 * * 5", datetime(2026, 10, 18)) == datetime(2026, 10, 23)
+
+
+def test_day_step_counts_as_unrestricted():
+    # As in Vixie cron: odd days that are Mondays, not odd days or Mondays
+    assert next_after("0 0 */2 * 1", datetime(2026, 10, 19)) == datetime(2026, 11, 9)
+
+
+def test_leap_day():
+    assert next_after("0 0 29 2 *", datetime(2026, 10, 18)) == datetime(2028, 2, 29)
+
+
+@pytest.mark.parametrize(
+    "expression", ["* * *", "61 * * * *", "* 24 * * *", "0 0 0 * *", "*/0 * * * *"]
+)
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
+
+
+def test_expression_that_never_matches():
+    with pytest.raises(ValueError):
+        next_after("0 0 31 2 *", datetime(2026, 10, 18))
+
+
+def test_interval_runs_are_anchored_to_the_epoch():
+    schedule = ScanSchedule("10.0.0.0/24", interval_hours=12)
+    assert schedule.next_run(0) == 43200
+    assert schedule.next_run(43199.5) == 43200
+    assert schedule.next_run(43200) == 86400
+
+
+def test_cron_next_run_uses_local_time():
+    schedule = ScanSchedule("10.0.0.5", cron="30 */6 * * *")
+    after = datetime(2026, 10, 18, 5, 31).timestamp()
+    assert datetime.fromtimestamp(schedule.next_run(after)) == datetime(
+        2026, 10, 18, 6, 30
+    )
+
+
+def test_first_run():
+    schedule = ScanSchedule("10.0.0.0/24", interval_hours=1)
+    now = 10 * 3600 + 600
+    # Never scanned, or the last scan is a full interval old: right away
+    assert schedule.first_run(now, None) == now
+    assert schedule.first_run(now, now - 3600) == now
+    # Scanned recently: wait for the next scheduled time
+    assert schedule.first_run(now, now - 60) == 11 * 3600
+
+    cron = ScanSchedule("10.0.0.5", cron="0 * * * *")
+    assert cron.first_run(now, None) == cron.next_run(now)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"interval_hours": 1, "cron": "@daily"}, {"interval_hours": 0}],
+)
+def test_invalid_schedules(options):
+    with pytest.raises(ValueError):
+        ScanSchedule("10.0.0.0/24", **options)
+
+
+def test_load_schedules(tmp_path):
+    path = tmp_path / "targets.json"
+    path.write_text(
+        json.dumps(
+            [
+                {"target": "10.0.0.0/24", "interval_hours": 12},
+                {"target": "10.0.0.5", "cron": "30 */6 * * *", "jitter_seconds": 0},
+            ]
+        )
+    )
+    interval, cron = load_schedules(path)
+    assert (interval.target, interval.interval, interval.cron) == (
+        "10.0.0.0/24",
+        43200,
+        None,
+    )
+    assert (cron.target, cron.cron.expression, cron.jitter_seconds) == (
+        "10.0.0.5",
+        "30 */6 * * *",
+        0,
+    )
@@ -0,0 +1,62 @@
+import json
+import random
+
+from app.storage import apply_delta, compute_delta
+
+
+def round_trip(base, new):
+    """Checks that the delta from `base` to `new` rebuilds `new` byte for byte."""
+    delta = compute_delta(base, new)
+    rebuilt = base if delta is None else apply_delta(base, delta)
+    assert json.dumps(rebuilt) == json.dumps(new)
+
+
+def shuffled(value, rng):
+    """Returns an equal copy of `value` with the keys of some objects reordered."""
+    if isinstance(value, dict):
+        keys = list(value)
+        if rng.random() < 0.3:
+            rng.shuffle(keys)
+        return {key: shuffled(value[key], rng) for key in keys}
+    if isinstance(value, list):
+        return [shuffled(item, rng) for item in value]
+    return value
+
+
+def random_value(rng, depth=0):
+    kind = rng.random()
+    if depth > 2 or kind < 0.3:
+        return rng.choice([1, 1.0, True, "1", None, "open", 22])
+    if kind < 0.65:
+        return {
+            rng.choice(["@portid", "@protocol", "state", "service", "a", "b"]): (
+                random_value(rng, depth + 1)
+            )
+            for _ in range(rng.randint(0, 4))
+        }
+    return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+
+
+def test_key_order_only_change():
+    base = {"host": [{"address": "10.0.0.1", "status": {"@state": "up", "@x": 1}}]}
+    new = {"host": [{"address": "10.0.0.1", "status": {"@x": 1, "@state": "up"}}]}
+    assert compute_delta(base, new) is not None
+    round_trip(base, new)
+
+
+def test_equal_values_of_other_types():
+    round_trip({"a": 1}, {"a": 1.0})
+    round_trip({"a": [1]}, {"a": [True]})
+
+
+def test_identical_documents_need_no_delta():
+    document = {"nmap_data": {"host": [{"address": "10.0.0.1"}]}}
+    assert compute_delta(document, json.loads(json.dumps(document))) is None
+
+
+def test_random_round_trips():
+    rng = random.Random(1)
+    for _ in range(5000):
+        base = random_value(rng)
+        new = shuffled(base, rng) if rng.random() < 0.5 else random_value(rng)
+        round_trip(base, new)